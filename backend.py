@@ -5,6 +5,8 @@ from pathlib import Path
 import logging
 import sys
 import json
+import threading
+from functools import wraps
 
 import helpers.setupdb as setupdb
 import helpers.addserver as addserver
@@ -31,6 +33,35 @@ CACHE_DIR = Path(os.path.join(CURRENT_DIR, "database", "cache"))
 SCHEDULE_FILE = os.path.join(CURRENT_DIR, "schedule.json")
 PREFERENCES_FILE = os.path.join(CURRENT_DIR, "preferences.json")
 
+# --- SQL ---
+# Kept as constants so every call passes the identical text and reuses SQLite's compiled statement
+SELECT_SERVERS_SQL = "SELECT id, name, url, username, password, port FROM servers"
+UPDATE_SERVER_SQL = "UPDATE servers SET name=?, url=?, username=?, password=?, port=? WHERE id=?"
+SELECT_CATEGORIES_SQL = "SELECT id, category_name, content_type, visible FROM categories ORDER BY content_type, category_name"
+SELECT_CATEGORIES_BY_TYPE_SQL = "SELECT id, category_name, visible FROM categories WHERE content_type = ? ORDER BY category_name"
+UPDATE_CATEGORY_VISIBILITY_SQL = "UPDATE categories SET visible=? WHERE id=?"
+SELECT_LIVE_CATEGORIES_SQL = "SELECT id, category_id, category_name, visible FROM categories WHERE content_type = 'live' ORDER BY category_name"
+SELECT_LIVE_STREAMS_SQL = "SELECT id, name, visible FROM live_streams WHERE category_id = ? ORDER BY name"
+UPDATE_LIVE_STREAM_VISIBILITY_SQL = "UPDATE live_streams SET visible = ? WHERE id = ?"
+# All six statistics in one statement, in the order of STATISTICS_KEYS
+STATISTICS_KEYS = ('total_movies', 'total_series', 'total_episodes', 'visible_movies', 'visible_series', 'visible_episodes')
+STATISTICS_SQL = """
+    SELECT
+        (SELECT COUNT(id) FROM vod_streams),
+        (SELECT COUNT(id) FROM series),
+        (SELECT COUNT(id) FROM episodes),
+        (SELECT COUNT(v.id) FROM vod_streams v JOIN categories c ON v.category_id = c.id WHERE c.visible = 1),
+        (SELECT COUNT(s.id) FROM series s JOIN categories c ON s.category_id = c.id WHERE c.visible = 1),
+        (SELECT COUNT(e.id) FROM episodes e JOIN series s ON e.series_id = s.id JOIN categories c ON s.category_id = c.id WHERE c.visible = 1)
+"""
+
+# Last result of get_database_statistics(); recomputed only after a write marks it dirty.
+# Shared by the GUI and worker threads, so always accessed under _stats_lock.
+_stats_lock = threading.Lock()
+_stats_cache = {}
+_stats_dirty = True
+_stats_generation = 0 # Bumped on every invalidation so a query racing a write is never cached
+
 # Setup logging
 log_file_path = Path('fynix_library_builder.log')
 logging.basicConfig(level=logging.DEBUG,
@@ -95,6 +126,38 @@ def load_schedule():
         logging.error(f"Failed to load schedule: {e}")
         return {'enabled': False, 'time': "03:00"} # Return default on error
 
+def _invalidate_statistics():
+    """Marks the cached database statistics as stale."""
+    global _stats_dirty, _stats_generation
+    with _stats_lock:
+        _stats_dirty = True
+        _stats_generation += 1
+
+def _invalidates_statistics(task_func):
+    """Invalidates the statistics cache once the wrapped task has finished writing, even if it failed."""
+    @wraps(task_func)
+    def wrapper(*args, **kwargs):
+        try:
+            return task_func(*args, **kwargs)
+        finally:
+            _invalidate_statistics()
+    return wrapper
+
+# --- Database Connection ---
+def _connect(**kwargs):
+    """Opens a connection to the library database tuned for the GUI and worker threads sharing it.
+
+    WAL lets the main thread read statistics and save settings while a library update is
+    writing from the worker thread; busy_timeout makes either side wait instead of failing.
+    """
+    conn = sqlite3.connect(DB_FILEPATH, timeout=5.0, **kwargs)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-20000")
+    return conn
+
 # --- Database Existence Check ---
 def database_exists():
     """Checks if the database file exists."""
@@ -104,7 +167,7 @@ def check_for_missing_tables():
     """Checks if 'live_streams' or 'epg_data' tables are missing from the database."""
     conn = None
     try:
-        conn = sqlite3.connect(DB_FILEPATH)
+        conn = _connect()
         cursor = conn.cursor()
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name IN ('live_streams', 'epg_data');")
         existing_tables = [row[0] for row in cursor.fetchall()]
@@ -130,7 +193,7 @@ def migrate_database(progress_callback=None):
     
     conn = None
     try:
-        conn = sqlite3.connect(DB_FILEPATH)
+        conn = _connect()
         cursor = conn.cursor()
 
         live_streams_sql = '''
@@ -210,7 +273,7 @@ def check_live_streams_visible_column_exists():
     """Checks if the 'visible' column exists in the 'live_streams' table."""
     conn = None
     try:
-        conn = sqlite3.connect(DB_FILEPATH)
+        conn = _connect()
         cursor = conn.cursor()
         cursor.execute("PRAGMA table_info(live_streams);")
         columns = [row[1] for row in cursor.fetchall()]
@@ -237,7 +300,7 @@ def migrate_add_visible_column_to_live_streams(progress_callback=None):
 
     conn = None
     try:
-        conn = sqlite3.connect(DB_FILEPATH)
+        conn = _connect()
         cursor = conn.cursor()
         cursor.execute("ALTER TABLE live_streams ADD COLUMN visible INTEGER DEFAULT 1;")
         conn.commit()
@@ -262,10 +325,10 @@ def get_servers():
     """Retrieves all servers from the database."""
     conn = None
     try:
-        conn = sqlite3.connect(DB_FILEPATH)
+        conn = _connect()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
-        cursor.execute("SELECT id, name, url, username, password, port FROM servers")
+        cursor.execute(SELECT_SERVERS_SQL)
         servers = cursor.fetchall()
         return [dict(server) for server in servers]
     except sqlite3.Error as e:
@@ -279,12 +342,9 @@ def update_server(server_id, name, url, username, password, port):
     """Updates a server's details in the database."""
     conn = None
     try:
-        conn = sqlite3.connect(DB_FILEPATH)
+        conn = _connect()
         cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE servers SET name=?, url=?, username=?, password=?, port=? WHERE id=?",
-            (name, url, username, password, port, server_id)
-        )
+        cursor.execute(UPDATE_SERVER_SQL, (name, url, username, password, port, server_id))
         conn.commit()
         logging.info(f"Server '{name}' updated successfully!")
         return True
@@ -295,14 +355,32 @@ def update_server(server_id, name, url, username, password, port):
         if conn:
             conn.close()
 
-def get_categories():
-    """Retrieves all categories from the database."""
+def ensure_category_type_index():
+    """Creates the (content_type, category_name) index on databases set up before it existed."""
+    conn = None
+    try:
+        conn = _connect()
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_categories_type_name ON categories(content_type, category_name)")
+        conn.commit()
+        return True
+    except sqlite3.Error as e:
+        logging.warning(f"Index creation warning: {e}")
+        return False
+    finally:
+        if conn:
+            conn.close()
+
+def get_categories(content_type=None):
+    """Retrieves categories from the database, optionally only those of one content type."""
     conn = None
     try:
-        conn = sqlite3.connect(DB_FILEPATH)
+        conn = _connect()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
-        cursor.execute("SELECT id, category_name, content_type, visible FROM categories ORDER BY content_type, category_name")
+        if content_type is None:
+            cursor.execute(SELECT_CATEGORIES_SQL)
+        else:
+            cursor.execute(SELECT_CATEGORIES_BY_TYPE_SQL, (content_type,))
         categories = cursor.fetchall()
         return [dict(cat) for cat in categories]
     except sqlite3.Error as e:
@@ -316,13 +394,11 @@ def update_category_visibility(category_id, visible_status):
     """Updates the visibility of a category."""
     conn = None
     try:
-        conn = sqlite3.connect(DB_FILEPATH)
+        conn = _connect()
         cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE categories SET visible=? WHERE id=?",
-            (visible_status, category_id)
-        )
+        cursor.execute(UPDATE_CATEGORY_VISIBILITY_SQL, (visible_status, category_id))
         conn.commit()
+        _invalidate_statistics()
         return True
     except sqlite3.Error as e:
         logging.error(f"Failed to update category ID {category_id} visibility: {e}")
@@ -331,8 +407,51 @@ def update_category_visibility(category_id, visible_status):
         if conn:
             conn.close()
 
+def save_all(server_updates, category_visibility_updates, schedule=None):
+    """Saves server details and category visibility in a single transaction, then the schedule.
+
+    server_updates is a list of (name, url, username, password, port, server_id) tuples,
+    category_visibility_updates a list of (visible, category_id) tuples and schedule an
+    (enabled, time_str) pair. The schedule lives in its JSON file, not the database.
+    The transaction is skipped when both lists are empty, and the schedule when it is None.
+    """
+    if server_updates or category_visibility_updates:
+        if not _save_database_changes(server_updates, category_visibility_updates):
+            return False
+    if schedule is None:
+        return True
+    return save_schedule(*schedule)
+
+def _save_database_changes(server_updates, category_visibility_updates):
+    """Applies server and category visibility updates inside one BEGIN IMMEDIATE transaction."""
+    conn = None
+    try:
+        conn = _connect(isolation_level=None)
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.executemany(UPDATE_SERVER_SQL, server_updates)
+        cursor.executemany(UPDATE_CATEGORY_VISIBILITY_SQL, category_visibility_updates)
+        cursor.execute("COMMIT")
+        _invalidate_statistics()
+        logging.info(f"Saved {len(server_updates)} server(s) and {len(category_visibility_updates)} category visibility change(s).")
+        return True
+    except sqlite3.Error as e:
+        logging.error(f"Failed to save changes: {e}")
+        if conn and conn.in_transaction:
+            conn.rollback()
+        return False
+    finally:
+        if conn:
+            conn.close()
+
 def get_database_statistics():
-    """Queries the database to get various content statistics."""
+    """Queries the database to get various content statistics, reusing the last result until a write invalidates it."""
+    global _stats_cache, _stats_dirty
+    with _stats_lock:
+        if not _stats_dirty:
+            return dict(_stats_cache)
+        generation = _stats_generation
+
     stats = {
         'total_movies': 0, 'visible_movies': 0,
         'total_series': 0, 'visible_series': 0,
@@ -340,25 +459,16 @@ def get_database_statistics():
     }
     conn = None
     try:
-        conn = sqlite3.connect(DB_FILEPATH)
+        conn = _connect()
         cursor = conn.cursor()
-
-        # Total counts
-        cursor.execute("SELECT COUNT(id) FROM vod_streams")
-        stats['total_movies'] = cursor.fetchone()[0]
-        cursor.execute("SELECT COUNT(id) FROM series")
-        stats['total_series'] = cursor.fetchone()[0]
-        cursor.execute("SELECT COUNT(id) FROM episodes")
-        stats['total_episodes'] = cursor.fetchone()[0]
-
-        # Visible counts
-        cursor.execute("SELECT COUNT(v.id) FROM vod_streams v JOIN categories c ON v.category_id = c.id WHERE c.visible = 1")
-        stats['visible_movies'] = cursor.fetchone()[0]
-        cursor.execute("SELECT COUNT(s.id) FROM series s JOIN categories c ON s.category_id = c.id WHERE c.visible = 1")
-        stats['visible_series'] = cursor.fetchone()[0]
-        cursor.execute("SELECT COUNT(e.id) FROM episodes e JOIN series s ON e.series_id = s.id JOIN categories c ON s.category_id = c.id WHERE c.visible = 1")
-        stats['visible_episodes'] = cursor.fetchone()[0]
-
+        cursor.execute(STATISTICS_SQL)
+        stats.update(zip(STATISTICS_KEYS, cursor.fetchone()))
+
+        with _stats_lock:
+            # Only keep the result if nothing was written while it was being computed
+            if generation == _stats_generation:
+                _stats_cache = dict(stats)
+                _stats_dirty = False
     except sqlite3.Error as e:
         logging.error(f"Failed to retrieve database statistics: {e}")
     finally:
@@ -370,10 +480,10 @@ def get_live_categories():
     """Retrieves all live categories from the database."""
     conn = None
     try:
-        conn = sqlite3.connect(DB_FILEPATH)
+        conn = _connect()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
-        cursor.execute("SELECT id, category_id, category_name, visible FROM categories WHERE content_type = 'live' ORDER BY category_name")
+        cursor.execute(SELECT_LIVE_CATEGORIES_SQL)
         categories = cursor.fetchall()
         return [dict(cat) for cat in categories]
     except sqlite3.Error as e:
@@ -387,10 +497,10 @@ def get_live_streams_by_category(category_id):
     """Retrieves all live streams for a given category from the database."""
     conn = None
     try:
-        conn = sqlite3.connect(DB_FILEPATH)
+        conn = _connect()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
-        cursor.execute("SELECT id, name, visible FROM live_streams WHERE category_id = ? ORDER BY name", (category_id,))
+        cursor.execute(SELECT_LIVE_STREAMS_SQL, (category_id,))
         streams = cursor.fetchall()
         return [dict(stream) for stream in streams]
     except sqlite3.Error as e:
@@ -404,9 +514,9 @@ def update_live_stream_visibility(stream_id, visible):
     """Updates the visibility of a live stream."""
     conn = None
     try:
-        conn = sqlite3.connect(DB_FILEPATH)
+        conn = _connect()
         cursor = conn.cursor()
-        cursor.execute("UPDATE live_streams SET visible = ? WHERE id = ?", (visible, stream_id))
+        cursor.execute(UPDATE_LIVE_STREAM_VISIBILITY_SQL, (visible, stream_id))
         conn.commit()
         return True
     except sqlite3.Error as e:
@@ -420,9 +530,9 @@ def batch_update_live_stream_visibility(stream_ids, visible):
     """Updates the visibility of multiple live streams."""
     conn = None
     try:
-        conn = sqlite3.connect(DB_FILEPATH)
+        conn = _connect()
         cursor = conn.cursor()
-        cursor.executemany("UPDATE live_streams SET visible = ? WHERE id = ?", [(visible, stream_id) for stream_id in stream_ids])
+        cursor.executemany(UPDATE_LIVE_STREAM_VISIBILITY_SQL, [(visible, stream_id) for stream_id in stream_ids])
         conn.commit()
         return True
     except sqlite3.Error as e:
@@ -434,6 +544,7 @@ def batch_update_live_stream_visibility(stream_ids, visible):
 
 # --- Core Logic Functions ---
 
+@_invalidates_statistics
 def run_initial_setup(server_details, movie_path, series_path, live_tv_path, progress_callback):
     """Runs the entire initial database setup and sync process."""
     server_name, server_url, server_username, server_password, server_port = server_details
@@ -467,6 +578,7 @@ def run_initial_setup(server_details, movie_path, series_path, live_tv_path, pro
     progress_callback("All scripts completed successfully!\n")
     return True
 
+@_invalidates_statistics
 def run_library_update(process_live_tv, progress_callback=None):
     """Runs the full library update process."""
     progress_callback("Starting library update...")
@@ -522,6 +634,7 @@ def run_library_update(process_live_tv, progress_callback=None):
     progress_callback("Library update completed successfully!")
     return True
 
+@_invalidates_statistics
 def run_clear_cache(progress_callback):
     """Clears all cached metadata."""
     progress_callback("Clearing cache...")
@@ -3,6 +3,7 @@ import logging
 from pathlib import Path
 import os
 import re
+from functools import lru_cache
 from xml.etree import ElementTree as ET
 from xml.dom import minidom # For pretty printing XML
 import json # For parsing video/audio JSON
@@ -14,6 +15,17 @@ logger = logging.getLogger(__name__)
 # Paths
 DB_PATH = Path(__file__).parent.parent / "database" / "media_player.db"
 
+# Common quality/resolution prefixes and bracketed tags. Most common prefixes come first,
+# and explicit character classes stand in for re.IGNORECASE.
+_RE_PREFIX = re.compile(
+    r'\A(?:[Hh][Dd](?:\.-|\s*-\s*|\s*)'
+    r'|4[Kk](?:-[Dd]\.-|\.-|\s*-\s*|\s*)'
+    r'|[Ff][Hh][Dd](?:\.-|\s*-\s*|\s*)'
+    r'|[Ss][Dd](?:\.-|\s*-\s*|\s*)'
+    r'|\[.*?\])\s*'
+)
+
+@lru_cache(maxsize=32768)
 def _sanitize_name(name: str) -> str:
     """Sanitizes a string for use as a filename, removing common prefixes, years, and cleaning up."""
     # Remove prefix up to and including the first ' - '
@@ -24,7 +36,7 @@ def _sanitize_name(name: str) -> str:
     name = re.sub(r'\s*\([^)]*\)', '', name)
 
     # Remove common quality/resolution prefixes and other tags in brackets
-    name = re.sub(r'^(?:4K-D\.-|4K\.-|HD\.-|FHD\.-|SD\.-|4K\s*-\s*|HD\s*-\s*|FHD\s*-\s*|SD\s*-\s*|4K\s*|HD\s*|FHD\s*|SD\s*|\[.*?\])\s*', '', name, flags=re.IGNORECASE).strip()
+    name = _RE_PREFIX.sub('', name).strip()
 
     # Replace dots with spaces (assuming dots are separators, not part of the title itself) and handle multiple spaces
     sanitized = re.sub(r'\.+', ' ', name) # Replace one or more dots with a single space
@@ -37,6 +49,7 @@ def _sanitize_name(name: str) -> str:
 
     return sanitized
 
+@lru_cache(maxsize=32768)
 def _extract_year(release_date: str, name: str) -> str:
     """Extracts year from release_date or name."""
     year = ""
@@ -3,8 +3,10 @@ import logging
 from pathlib import Path
 import os
 import re
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 import helpers.config_manager as config_manager
-from helpers.create_nfo_files import create_single_nfo_file # Import the new function
+from helpers.create_nfo_files import _create_nfo_xml # Reuse the NFO builder
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -13,6 +15,20 @@ logger = logging.getLogger(__name__)
 # Paths
 DB_PATH = Path(__file__).parent.parent / "database" / "media_player.db"
 
+# Number of threads used to flush .strm/.nfo files to disk
+WRITE_WORKERS = 16
+
+# Common quality/resolution prefixes and bracketed tags. Most common prefixes come first,
+# and explicit character classes stand in for re.IGNORECASE.
+_RE_PREFIX = re.compile(
+    r'\A(?:[Hh][Dd](?:\.-|\s*-\s*|\s*)'
+    r'|4[Kk](?:-[Dd]\.-|\.-|\s*-\s*|\s*)'
+    r'|[Ff][Hh][Dd](?:\.-|\s*-\s*|\s*)'
+    r'|[Ss][Dd](?:\.-|\s*-\s*|\s*)'
+    r'|\[.*?\])\s*'
+)
+
+@lru_cache(maxsize=32768)
 def _sanitize_name(name: str) -> str:
     """Sanitizes a string for use as a filename, removing common prefixes, years, and cleaning up."""
     # Remove prefix up to and including the first ' - '
@@ -23,7 +39,7 @@ def _sanitize_name(name: str) -> str:
     name = re.sub(r'\s*\([^)]*\)', '', name)
 
     # Remove common quality/resolution prefixes and other tags in brackets
-    name = re.sub(r'^(?:4K-D\.-|4K\.-|HD\.-|FHD\.-|SD\.-|4K\s*-\s*|HD\s*-\s*|FHD\s*-\s*|SD\s*-\s*|4K\s*|HD\s*|FHD\s*|SD\s*|\[.*?\])\s*', '', name, flags=re.IGNORECASE).strip()
+    name = _RE_PREFIX.sub('', name).strip()
 
     # Replace dots with spaces (assuming dots are separators, not part of the title itself) and handle multiple spaces
     sanitized = re.sub(r'\.+', ' ', name) # Replace one or more dots with a single space
@@ -36,6 +52,7 @@ def _sanitize_name(name: str) -> str:
 
     return sanitized
 
+@lru_cache(maxsize=32768)
 def _extract_year(release_date: str, name: str) -> str:
     """Extracts year from release_date or name."""
     year = ""
@@ -53,6 +70,38 @@ def _extract_year(release_date: str, name: str) -> str:
         
     return ""
 
+def _write_new_file(path: Path, data: bytes) -> bool:
+    """Writes data to path only if the file does not already exist. Returns False if it did."""
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o644)
+    except FileExistsError:
+        return False
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+    return True
+
+def _flush_pair(item: tuple) -> None:
+    """Writes one prepared .strm file and, if it was newly created, its .nfo file."""
+    stream_id, original_name, strm_filepath, strm_bytes, nfo_filepath, nfo_bytes = item
+    try:
+        if not _write_new_file(strm_filepath, strm_bytes):
+            logger.debug(f"Skipping existing .strm file: {strm_filepath}")
+            return
+        logger.debug(f"Created .strm file: {strm_filepath}")
+
+        if nfo_bytes is None:
+            return
+        if _write_new_file(nfo_filepath, nfo_bytes):
+            logger.debug(f"Created .nfo file: {nfo_filepath}")
+        else:
+            logger.debug(f"Skipping existing .nfo file: {nfo_filepath}")
+    except Exception as e:
+        logger.error(f"Error creating .strm file for {original_name} ({stream_id}): {e}", exc_info=True)
+
 def create_strm_files() -> bool:
     logger.info("Starting creation of .strm files for VOD streams.")
     
@@ -91,20 +140,20 @@ def create_strm_files() -> bool:
         vod_streams = cursor.fetchall()
         logger.info(f"Found {len(vod_streams)} VOD streams to process (visible categories only).")
 
+        # Phase 1: build every .strm/.nfo payload in memory
+        pending = []
+        seen_paths = set()
         for stream in vod_streams:
-            # Convert sqlite3.Row to a dictionary
-            stream_dict = dict(stream)
-
-            stream_id = stream_dict['stream_id']
-            original_name = stream_dict['name'] # Keep original name for year extraction fallback
-            o_name = stream_dict['o_name']
-            release_date = stream_dict['release_date']
-            container_extension = stream_dict['container_extension']
-            direct_source = stream_dict['direct_source']
-            server_url = stream_dict['url']
-            server_username = stream_dict['username']
-            server_password = stream_dict['password']
-            server_port = stream_dict['port']
+            stream_id = stream['stream_id']
+            original_name = stream['name'] # Keep original name for year extraction fallback
+            o_name = stream['o_name']
+            release_date = stream['release_date']
+            container_extension = stream['container_extension']
+            direct_source = stream['direct_source']
+            server_url = stream['url']
+            server_username = stream['username']
+            server_password = stream['password']
+            server_port = stream['port']
 
             # Determine movie name for filename
             # Prioritize o_name if it exists and is not empty/whitespace after initial sanitization
@@ -128,11 +177,12 @@ def create_strm_files() -> bool:
             
             strm_filepath = movies_path / f"{filename_base}.strm"
 
-            # Only create if file doesn't exist
-            if strm_filepath.exists():
+            # Only create if file doesn't exist (on disk or earlier in this run)
+            if strm_filepath in seen_paths or strm_filepath.exists():
                 logger.debug(f"Skipping existing .strm file: {strm_filepath}")
                 # If STRM exists, assume NFO also exists or was handled. Skip NFO creation too.
                 continue
+            seen_paths.add(strm_filepath)
 
             # Construct the full stream URL
             # Ensure the server URL starts with http://
@@ -144,18 +194,22 @@ def create_strm_files() -> bool:
 
             # Example: http://serveraddress:port/movie/username/password/stream_id.container_extension
             full_stream_url = f"{processed_server_url}:{server_port}/movie/{server_username}/{server_password}/{stream_id}.{container_extension}"
-            
-            try:
-                with open(strm_filepath, "w") as f:
-                    f.write(full_stream_url)
-                logger.debug(f"Created .strm file: {strm_filepath}")
-                
-                # Create corresponding .nfo file
-                create_single_nfo_file(stream_dict, filename_base, movies_path)
 
+            # Build the corresponding .nfo content (the NFO builder does key lookups, so it needs a real dict)
+            nfo_filepath = movies_path / f"{filename_base}.nfo"
+            try:
+                nfo_bytes = _create_nfo_xml(dict(stream)).encode("utf-8")
             except Exception as e:
-                logger.error(f"Error creating .strm file for {original_name} ({stream_id}): {e}", exc_info=True)
-                # Continue to next stream even if one fails
+                logger.error(f"Error creating .nfo file for {original_name} ({stream_id}): {e}", exc_info=True)
+                nfo_bytes = None
+
+            pending.append((stream_id, original_name, strm_filepath, full_stream_url.encode("utf-8"), nfo_filepath, nfo_bytes))
+
+        # Phase 2: flush the prepared files concurrently to overlap filesystem latency
+        logger.info(f"Writing {len(pending)} new .strm files.")
+        with ThreadPoolExecutor(max_workers=WRITE_WORKERS) as executor:
+            for _ in executor.map(_flush_pair, pending):
+                pass
 
         logger.info("Finished creating .strm and .nfo files.")
         return True
@@ -2,7 +2,8 @@ import sqlite3
 import requests
 import logging
 from pathlib import Path
-import xml.etree.ElementTree as ET
+from io import BytesIO
+from itertools import chain
 from requests.exceptions import RequestException
 from urllib.parse import urljoin
 import urllib3
@@ -11,6 +12,13 @@ import pickle
 from datetime import datetime, timedelta
 import re
 
+try:
+    from lxml import etree as ET
+    HAS_LXML = True
+except ImportError:
+    import xml.etree.ElementTree as ET
+    HAS_LXML = False
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -70,10 +78,23 @@ def xmltv_to_sqlite_timestamp(xmltv_str):
 
 
 def parse_epg_xml(xml_data):
-    epg_entries = []
+    # Stream <programme> elements one at a time and free each once read,
+    # so peak memory stays at a single element rather than the whole document.
+    parsed_count = 0
+    root = None
     try:
-        tree = ET.fromstring(xml_data)
-        for prog in tree.findall('programme'):
+        if HAS_LXML:
+            context = ET.iterparse(BytesIO(xml_data), events=('end',), tag='programme', huge_tree=True)
+        else:
+            context = ET.iterparse(BytesIO(xml_data), events=('start', 'end'))
+        for event, prog in context:
+            if event == 'start':
+                # Only the stdlib parser asks for start events; the first one is the <tv> root
+                if root is None:
+                    root = prog
+                continue
+            if prog.tag != 'programme':
+                continue
             channel_id = prog.get('channel')
             start_time = xmltv_to_sqlite_timestamp(prog.get('start'))
             stop_time = xmltv_to_sqlite_timestamp(prog.get('stop'))
@@ -83,7 +104,7 @@ def parse_epg_xml(xml_data):
             category = prog.findtext('category')
             icon_elem = prog.find('icon')
             icon = icon_elem.get('src') if icon_elem is not None else None
-            epg_entries.append({
+            entry = {
                 'channel_id': channel_id,
                 'start_time': start_time,
                 'stop_time': stop_time,
@@ -92,31 +113,61 @@ def parse_epg_xml(xml_data):
                 'lang': lang,
                 'category': category,
                 'icon': icon
-            })
-        logger.info(f"Parsed {len(epg_entries)} EPG entries from XML.")
+            }
+            prog.clear()
+            if HAS_LXML:
+                # Drop already-processed siblings so the tree never grows past one programme
+                while prog.getprevious() is not None:
+                    del prog.getparent()[0]
+            else:
+                # The stdlib tree has no parent links, so empty the root instead
+                root.clear()
+            parsed_count += 1
+            yield entry
+        logger.info(f"Parsed {parsed_count} EPG entries from XML.")
     except Exception as e:
-        logger.error(f"Error parsing EPG XML: {e}")
-    return epg_entries
+        # Re-raise so a truncated or malformed download never replaces the stored guide
+        logger.error(f"Error parsing EPG XML after {parsed_count} entries: {e}")
+        raise
 
 
 def insert_epg_entries(conn, epg_entries):
     cursor = conn.cursor()
-    # Clear existing EPG data first
-    cursor.execute("DELETE FROM epg_data")
-    conn.commit()
-    logger.info("Cleared old EPG data.")
-
-    for entry in epg_entries:
-        cursor.execute("""
-            INSERT OR IGNORE INTO epg_data
+    # Load everything into an unindexed temp table first, then copy it across in one
+    # statement so the UNIQUE index on epg_data is maintained in a single bulk pass.
+    cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS tmp_epg (
+            channel_id, start_time, stop_time, title, description, lang, category, icon
+        )
+    """)
+    try:
+        # Everything from here to the commit is one transaction: the old guide is only
+        # replaced once the whole XML has been parsed into tmp_epg.
+        cursor.execute("DELETE FROM tmp_epg")
+        cursor.executemany("""
+            INSERT INTO tmp_epg
             (channel_id, start_time, stop_time, title, description, lang, category, icon)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         """, (
-            entry['channel_id'], entry['start_time'], entry['stop_time'], entry['title'],
-            entry['description'], entry['lang'], entry['category'], entry['icon']
+            (entry['channel_id'], entry['start_time'], entry['stop_time'], entry['title'],
+             entry['description'], entry['lang'], entry['category'], entry['icon'])
+            for entry in epg_entries
         ))
-    conn.commit()
-    logger.info(f"Inserted {len(epg_entries)} new EPG entries.")
+        cursor.execute("DELETE FROM epg_data")
+        cursor.execute("""
+            INSERT OR IGNORE INTO epg_data
+            (channel_id, start_time, stop_time, title, description, lang, category, icon)
+            SELECT channel_id, start_time, stop_time, title, description, lang, category, icon
+            FROM tmp_epg
+        """)
+        inserted = cursor.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.execute("DROP TABLE IF EXISTS tmp_epg")
+    logger.info(f"Replaced old EPG data with {inserted} new EPG entries.")
 
 
 def _generate_cache_key(url: str) -> str:
@@ -147,6 +198,13 @@ def _save_to_cache(cache_key: str, xml_data: bytes) -> bool:
         return False
 
 
+def _evict_cache(cache_key: str) -> None:
+    try:
+        _get_cache_file_path(cache_key).unlink(missing_ok=True)
+    except Exception as e:
+        logger.warning(f"Error removing EPG XML cache {cache_key}: {e}")
+
+
 def _load_from_cache(cache_key: str) -> bytes:
     try:
         cache_file = _get_cache_file_path(cache_key)
@@ -194,12 +252,21 @@ def main():
         logger.info(f"Downloaded and cached EPG XML for URL: {url}")
 
     epg_entries = parse_epg_xml(xml_data)
-    if not epg_entries:
-        logger.error("No EPG entries parsed.")
+    try:
+        first_entry = next(epg_entries, None)
+        if first_entry is None:
+            logger.error("No EPG entries parsed.")
+            # Don't keep serving an unusable XML from the cache until it expires
+            _evict_cache(cache_key)
+            conn.close()
+            return False
+
+        insert_epg_entries(conn, chain((first_entry,), epg_entries))
+    except Exception as e:
+        logger.error(f"EPG import failed, existing EPG data kept: {e}")
+        _evict_cache(cache_key)
         conn.close()
         return False
-
-    insert_epg_entries(conn, epg_entries)
     conn.close()
     logger.info("EPG import completed.")
     return True
@@ -122,7 +122,8 @@ class MediaPlayerDB:
                     bitrate INTEGER,
                     status TEXT,
                     runtime TEXT,
-                    clearlogo TEXT
+                    clearlogo TEXT,
+                    meta_hash TEXT
                 )
             ''',
             
@@ -204,6 +205,17 @@ class MediaPlayerDB:
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     UNIQUE(user_id, preference_key)
                 )
+            ''',
+            
+            'sync_state': '''
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    server_id INTEGER,
+                    content_type TEXT,
+                    content_hash TEXT,
+                    synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (server_id, content_type),
+                    FOREIGN KEY (server_id) REFERENCES servers (id) ON DELETE CASCADE
+                )
             '''
         }
         
@@ -237,6 +249,7 @@ class MediaPlayerDB:
             
             # VOD streams indexes  
             "CREATE INDEX IF NOT EXISTS idx_vod_server_category ON vod_streams(server_id, category_id)",
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_vod_unique_stream ON vod_streams(server_id, stream_id)",
             "CREATE INDEX IF NOT EXISTS idx_vod_name ON vod_streams(name)",
             "CREATE INDEX IF NOT EXISTS idx_vod_genre ON vod_streams(genre)",
             "CREATE INDEX IF NOT EXISTS idx_vod_rating ON vod_streams(rating)",
@@ -244,6 +257,7 @@ class MediaPlayerDB:
             
             # Series indexes
             "CREATE INDEX IF NOT EXISTS idx_series_server_category ON series(server_id, category_id)",
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_series_server_sid ON series(server_id, series_id)",
             "CREATE INDEX IF NOT EXISTS idx_series_name ON series(name)",
             "CREATE INDEX IF NOT EXISTS idx_series_genre ON series(genre)",
             "CREATE INDEX IF NOT EXISTS idx_series_rating ON series(rating)",
@@ -251,10 +265,12 @@ class MediaPlayerDB:
             # Episodes indexes
             "CREATE INDEX IF NOT EXISTS idx_episodes_series ON episodes(series_id)",
             "CREATE INDEX IF NOT EXISTS idx_episodes_season ON episodes(series_id, season_num)",
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_episodes_unique_episode ON episodes(server_id, episode_id)",
             
             # Categories indexes
             "CREATE INDEX IF NOT EXISTS idx_categories_server_type ON categories(server_id, content_type)",
             "CREATE INDEX IF NOT EXISTS idx_categories_parent ON categories(parent_id)",
+            "CREATE INDEX IF NOT EXISTS idx_categories_type_name ON categories(content_type, category_name)",
             
             # EPG indexes
             "CREATE INDEX IF NOT EXISTS idx_epg_channel_time ON epg_data(channel_id, start_time)",
@@ -296,6 +312,8 @@ class MediaPlayerDB:
             return True
         
         logger.info("Setting up new database...")
+        # Must be set before the first table exists; lets vacuumdb reclaim space incrementally
+        self.conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
         success = self.create_tables()
         
         if success:
@@ -1,15 +1,22 @@
 import sqlite3
 import requests
+from requests.adapters import HTTPAdapter
 import json
+import os
 import logging
 import time
 import hashlib
 import pickle
+import mmap
 import urllib3
+import threading
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
-from urllib.parse import urljoin
-from datetime import datetime, timedelta
+from urllib.parse import urljoin, urlsplit
+from collections import defaultdict
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 # Disable SSL warnings for IPTV servers with invalid certificates
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -18,6 +25,38 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+CONTENT_TYPES = ['live', 'vod', 'series']
+
+# Maximum number of category downloads in flight at once
+DOWNLOAD_WORKERS = 8
+
+# (connect, read) timeouts in seconds; a short connect timeout fails fast on dead hosts
+TEST_TIMEOUT = (10, 20)
+DOWNLOAD_TIMEOUT = (10, 30)
+
+# Minimum spacing in seconds between real API requests to the same host
+REQUEST_INTERVAL = 0.5
+
+@lru_cache(maxsize=4096)
+def _cache_key_for(url: str, username: str, content_type: str) -> str:
+    """Hash server details and content type into a cache key (memoized)"""
+    key_data = f"{url}|{username}|{content_type}".encode()
+    return hashlib.blake2b(key_data, digest_size=16).hexdigest()
+
+@lru_cache(maxsize=256)
+def _api_base_for(url: str, port, username: str, password: str) -> str:
+    """Build the player_api.php URL with credentials for a server (memoized)"""
+    base_url = url
+    if not base_url.startswith(('http://', 'https://')):
+        base_url = f"http://{base_url}"
+    
+    if port and port != 80:
+        if ':' not in base_url.split('://', 1)[1]:
+            base_url = f"{base_url}:{port}"
+    
+    api_url = urljoin(base_url, '/player_api.php')
+    return f"{api_url}?username={username}&password={password}"
+
 class XtreamCategoriesDownloader:
     def __init__(self, db_path: str = None, cache_hours: int = 24):
         """Initialize the categories downloader with caching support"""
@@ -30,12 +69,17 @@ class XtreamCategoriesDownloader:
         self.db_path = Path(db_path)
         self.cache_hours = cache_hours
         self.conn = None
+        self._cur = None
         
         # Setup requests session with SSL handling for IPTV servers
         self.session = requests.Session()
-        self.session.timeout = 30
         self.session.verify = False  # Disable SSL verification for IPTV servers
         
+        # Keep-alive pool big enough for every concurrent download to reuse its connection
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=DOWNLOAD_WORKERS)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        
         # Set user agent to avoid blocking
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
@@ -44,46 +88,53 @@ class XtreamCategoriesDownloader:
         # Setup cache directory
         self.cache_dir = self.db_path.parent / "cache" / "categories"
         self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # Categories already loaded or saved during this run, keyed by cache key
+        self._mem_cache: Dict[str, List[Dict]] = {}
+        # Earliest monotonic time the next API request to each host may start
+        self._next_request = defaultdict(float)
+        self._rate_lock = threading.Lock()
         logger.info(f"Cache directory: {self.cache_dir}")
         logger.info("SSL verification disabled for IPTV server compatibility")
     
     def _generate_cache_key(self, server: Dict, content_type: str) -> str:
         """Generate a unique cache key for server + content type combination"""
-        # Create a unique identifier from server details and content type
-        key_data = f"{server['url']}_{server['username']}_{content_type}"
-        return hashlib.md5(key_data.encode()).hexdigest()
+        return _cache_key_for(server['url'], server['username'], content_type)
     
     def _get_cache_file_path(self, cache_key: str) -> Path:
         """Get the cache file path for a given cache key"""
         return self.cache_dir / f"{cache_key}.pkl"
     
-    def _is_cache_valid(self, cache_file: Path) -> bool:
+    def _cache_cutoff(self) -> float:
+        """Epoch time before which a cache file counts as expired"""
+        return time.time() - self.cache_hours * 3600
+    
+    def _is_cache_valid(self, cache_file: Path, cutoff: Optional[float] = None) -> bool:
         """Check if cache file exists and is not older than cache_hours"""
-        if not cache_file.exists():
+        if cutoff is None:
+            cutoff = self._cache_cutoff()
+        try:
+            return cache_file.stat().st_mtime > cutoff
+        except FileNotFoundError:
             return False
-        
-        file_modified = datetime.fromtimestamp(cache_file.stat().st_mtime)
-        expiry_time = datetime.now() - timedelta(hours=self.cache_hours)
-        
-        is_valid = file_modified > expiry_time
-        if is_valid:
-            logger.debug(f"Cache valid: {cache_file.name} (modified: {file_modified})")
-        else:
-            logger.debug(f"Cache expired: {cache_file.name} (modified: {file_modified}, expires after: {expiry_time})")
-        
-        return is_valid
     
     def _save_to_cache(self, cache_key: str, data: List[Dict]) -> bool:
         """Save API response data to cache"""
         try:
             cache_file = self._get_cache_file_path(cache_key)
             cache_data = {
-                'timestamp': datetime.now(),
+                'timestamp': time.time(),  # epoch seconds; cheaper to (un)pickle than a datetime
                 'data': data
             }
             
-            with open(cache_file, 'wb') as f:
-                pickle.dump(cache_data, f)
+            # Serialize in one go and hand the buffer to a single write call
+            payload = pickle.dumps(cache_data, protocol=pickle.HIGHEST_PROTOCOL)
+            # Write beside the target and swap it in, so a crash never leaves a torn cache file.
+            # No fsync: the cache can always be rebuilt from the API.
+            tmp_file = cache_file.with_suffix('.pkl.tmp')
+            with open(tmp_file, 'wb', buffering=1 << 20) as f:
+                f.write(payload)
+            os.replace(tmp_file, cache_file)
+            self._mem_cache[cache_key] = data
             
             logger.debug(f"Saved {len(data)} items to cache: {cache_file.name}")
             return True
@@ -94,19 +145,29 @@ class XtreamCategoriesDownloader:
     
     def _load_from_cache(self, cache_key: str) -> Optional[List[Dict]]:
         """Load data from cache if valid"""
+        if cache_key in self._mem_cache:
+            return self._mem_cache[cache_key]
+        
         try:
             cache_file = self._get_cache_file_path(cache_key)
             
             if not self._is_cache_valid(cache_file):
                 return None
             
+            # Unpickle straight from the page cache; mmap can't map an empty file
             with open(cache_file, 'rb') as f:
-                cache_data = pickle.load(f)
+                if os.fstat(f.fileno()).st_size == 0:
+                    return None
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    cache_data = pickle.loads(mm)
             
             data = cache_data.get('data', [])
             timestamp = cache_data.get('timestamp')
+            if isinstance(timestamp, float):
+                timestamp = datetime.fromtimestamp(timestamp)
             
             logger.info(f"Loaded {len(data)} items from cache: {cache_file.name} (cached: {timestamp})")
+            self._mem_cache[cache_key] = data
             return data
             
         except Exception as e:
@@ -117,11 +178,15 @@ class XtreamCategoriesDownloader:
         """Remove expired cache files"""
         try:
             expired_count = 0
-            for cache_file in self.cache_dir.glob("*.pkl"):
-                if not self._is_cache_valid(cache_file):
-                    cache_file.unlink()
-                    expired_count += 1
-                    logger.debug(f"Removed expired cache file: {cache_file.name}")
+            cutoff = self._cache_cutoff()
+            with os.scandir(self.cache_dir) as entries:
+                for entry in entries:
+                    if not entry.name.endswith('.pkl'):
+                        continue
+                    if entry.stat().st_mtime <= cutoff:
+                        os.unlink(entry.path)
+                        expired_count += 1
+                        logger.debug(f"Removed expired cache file: {entry.name}")
             
             if expired_count > 0:
                 logger.info(f"Cleaned up {expired_count} expired cache files")
@@ -132,16 +197,26 @@ class XtreamCategoriesDownloader:
     def get_cache_stats(self) -> Dict:
         """Get cache statistics"""
         try:
-            cache_files = list(self.cache_dir.glob("*.pkl"))
-            valid_files = [f for f in cache_files if self._is_cache_valid(f)]
-            expired_files = [f for f in cache_files if not self._is_cache_valid(f)]
+            cutoff = self._cache_cutoff()
+            total_files = valid_files = expired_files = total_size = 0
             
-            total_size = sum(f.stat().st_size for f in cache_files)
+            # Single scandir pass, one stat() per file
+            with os.scandir(self.cache_dir) as entries:
+                for entry in entries:
+                    if not entry.name.endswith('.pkl'):
+                        continue
+                    st = entry.stat()
+                    total_files += 1
+                    total_size += st.st_size
+                    if st.st_mtime > cutoff:
+                        valid_files += 1
+                    else:
+                        expired_files += 1
             
             return {
-                'total_files': len(cache_files),
-                'valid_files': len(valid_files),
-                'expired_files': len(expired_files),
+                'total_files': total_files,
+                'valid_files': valid_files,
+                'expired_files': expired_files,
                 'total_size_bytes': total_size,
                 'total_size_mb': round(total_size / 1024 / 1024, 2),
                 'cache_directory': str(self.cache_dir)
@@ -160,6 +235,16 @@ class XtreamCategoriesDownloader:
                 
             self.conn = sqlite3.connect(self.db_path)
             self.conn.row_factory = sqlite3.Row  # Enable dict-like access
+            # WAL + NORMAL sync avoids an fsync per commit; keep temp data and hot pages in memory
+            self.conn.executescript("""
+                PRAGMA journal_mode=WAL;
+                PRAGMA synchronous=NORMAL;
+                PRAGMA temp_store=MEMORY;
+                PRAGMA mmap_size=268435456;
+                PRAGMA cache_size=-65536;
+            """)
+            # One cursor reused by every query so SQLite's statement cache stays warm
+            self._cur = self.conn.cursor()
             logger.info(f"Connected to database: {self.db_path}")
             return True
         except sqlite3.Error as e:
@@ -168,6 +253,9 @@ class XtreamCategoriesDownloader:
     
     def close_db(self):
         """Close database connection"""
+        if self._cur:
+            self._cur.close()
+            self._cur = None
         if self.conn:
             self.conn.close()
             logger.info("Database connection closed")
@@ -175,13 +263,18 @@ class XtreamCategoriesDownloader:
     def get_servers(self) -> List[Dict]:
         """Get all active servers from database"""
         try:
+            # Own cursor so the shared one keeps its Row factory
             cursor = self.conn.cursor()
+            cursor.row_factory = None  # plain tuples; the columns are fixed below
             cursor.execute("""
                 SELECT id, name, url, username, password, port 
                 FROM servers 
                 WHERE status = 'active'
             """)
-            servers = [dict(row) for row in cursor.fetchall()]
+            servers = [
+                {'id': r[0], 'name': r[1], 'url': r[2], 'username': r[3], 'password': r[4], 'port': r[5]}
+                for r in cursor.fetchall()
+            ]
             logger.info(f"Found {len(servers)} active servers")
             return servers
         except sqlite3.Error as e:
@@ -190,22 +283,18 @@ class XtreamCategoriesDownloader:
     
     def build_api_url(self, server: Dict, action: str = "") -> str:
         """Build Xtream API URL"""
-        base_url = server['url']
-        if not base_url.startswith(('http://', 'https://')):
-            base_url = f"http://{base_url}"
-        
-        port = server.get('port', 80)
-        if port and port != 80:
-            if ':' not in base_url.split('://', 1)[1]:
-                base_url = f"{base_url}:{port}"
-        
-        api_url = urljoin(base_url, '/player_api.php')
-        
-        params = f"username={server['username']}&password={server['password']}"
-        if action:
-            params += f"&action={action}"
-            
-        return f"{api_url}?{params}"
+        base = _api_base_for(server['url'], server.get('port', 80), server['username'], server['password'])
+        return f"{base}&action={action}" if action else base
+    
+    def _wait_for_host(self, url: str):
+        """Space out API requests to the same host; cache hits never get here"""
+        host = urlsplit(url).netloc
+        with self._rate_lock:
+            now = time.monotonic()
+            slot = max(now, self._next_request[host])
+            self._next_request[host] = slot + REQUEST_INTERVAL
+        if slot > now:
+            time.sleep(slot - now)
     
     def test_server_connection(self, server: Dict) -> bool:
         """Test if server is reachable and credentials are valid"""
@@ -214,10 +303,10 @@ class XtreamCategoriesDownloader:
             logger.info(f"Testing server: {server['name']}")
             
             # Try with SSL verification disabled and increased timeout
-            response = self.session.get(url, timeout=20, verify=False)
+            response = self.session.get(url, timeout=TEST_TIMEOUT, verify=False)
             response.raise_for_status()
             
-            data = response.json()
+            data = json.loads(response.content)
             
             # Check if response contains user info (indicates valid credentials)
             if 'user_info' in data and data['user_info']:
@@ -233,9 +322,9 @@ class XtreamCategoriesDownloader:
             
             # Retry with explicit SSL disabled (double-check)
             try:
-                response = self.session.get(url, timeout=20, verify=False)
+                response = self.session.get(url, timeout=TEST_TIMEOUT, verify=False)
                 response.raise_for_status()
-                data = response.json()
+                data = json.loads(response.content)
                 
                 if 'user_info' in data and data['user_info']:
                     logger.info(f"Server {server['name']} is accessible (SSL verification bypassed)")
@@ -264,8 +353,8 @@ class XtreamCategoriesDownloader:
             logger.error(f"Unexpected error testing server {server['name']}: {e}")
             return False
     
-    def download_categories(self, server: Dict, content_type: str) -> List[Dict]:
-        """Download categories for specific content type with caching support"""
+    def download_categories(self, server: Dict, content_type: str) -> Tuple[List[Dict], bool]:
+        """Download categories for specific content type with caching support; returns (categories, was_cached)"""
         action_map = {
             'live': 'get_live_categories',
             'vod': 'get_vod_categories', 
@@ -274,7 +363,7 @@ class XtreamCategoriesDownloader:
         
         if content_type not in action_map:
             logger.error(f"Invalid content type: {content_type}")
-            return []
+            return [], False
         
         # Generate cache key and check cache first
         cache_key = self._generate_cache_key(server, content_type)
@@ -282,17 +371,18 @@ class XtreamCategoriesDownloader:
         
         if cached_data is not None:
             logger.info(f"Using cached {content_type} categories for {server['name']} ({len(cached_data)} items)")
-            return cached_data
+            return cached_data, True
         
         # Cache miss or expired - fetch from API
         try:
             url = self.build_api_url(server, action_map[content_type])
             logger.info(f"Fetching {content_type} categories from {server['name']} (cache miss)")
             
-            response = self.session.get(url, timeout=30, verify=False)
+            self._wait_for_host(url)
+            response = self.session.get(url, timeout=DOWNLOAD_TIMEOUT, verify=False)
             response.raise_for_status()
             
-            categories = response.json()
+            categories = json.loads(response.content)
             
             if isinstance(categories, list):
                 logger.info(f"Downloaded {len(categories)} {content_type} categories from {server['name']}")
@@ -301,123 +391,103 @@ class XtreamCategoriesDownloader:
                 if self._save_to_cache(cache_key, categories):
                     logger.debug(f"Cached {content_type} categories for {server['name']}")
                 
-                return categories
+                return categories, False
             else:
                 logger.warning(f"Unexpected response format for {content_type} categories from {server['name']}")
-                return []
+                return [], False
                 
         except requests.exceptions.SSLError as e:
             logger.warning(f"SSL error downloading {content_type} from {server['name']}: {e}")
             logger.info("SSL verification already disabled, this might be a server issue")
-            return []
+            return [], False
         except requests.exceptions.Timeout as e:
             logger.error(f"Timeout downloading {content_type} categories from {server['name']}: {e}")
-            return []
+            return [], False
         except requests.exceptions.ConnectionError as e:
             logger.error(f"Connection error downloading {content_type} categories from {server['name']}: {e}")
-            return []
+            return [], False
         except requests.RequestException as e:
             logger.error(f"Error downloading {content_type} categories from {server['name']}: {e}")
-            return []
+            return [], False
         except json.JSONDecodeError as e:
             logger.error(f"Invalid JSON response for {content_type} categories from {server['name']}: {e}")
-            return []
+            return [], False
         except Exception as e:
             logger.error(f"Unexpected error downloading {content_type} categories from {server['name']}: {e}")
-            return []
+            return [], False
     
-    def category_exists(self, server_id: int, category_id: int, content_type: str) -> bool:
-        """Check if category already exists in database"""
+    def get_existing_category_ids(self, server_id: int, content_type: str) -> set:
+        """Get the category ids already stored for a server and content type"""
         try:
-            cursor = self.conn.cursor()
+            cursor = self._cur
             cursor.execute("""
-                SELECT 1 FROM categories 
-                WHERE server_id = ? AND category_id = ? AND content_type = ?
-            """, (server_id, category_id, content_type))
-            return cursor.fetchone() is not None
+                SELECT category_id FROM categories 
+                WHERE server_id = ? AND content_type = ?
+            """, (server_id, content_type))
+            # Compare as strings: the API often sends ids as text while the column stores integers
+            return {str(row[0]) for row in cursor.fetchall()}
         except sqlite3.Error as e:
-            logger.error(f"Error checking category existence: {e}")
-            return False
+            logger.error(f"Error fetching existing categories: {e}")
+            return set()
     
-    def insert_category(self, server_id: int, category_data: Dict, content_type: str) -> bool:
-        """Insert category into database"""
-        try:
-            cursor = self.conn.cursor()
-            
-            # Extract category information
-            category_id = category_data.get('category_id')
-            category_name = category_data.get('category_name', 'Unknown')
-            parent_id = category_data.get('parent_id')
-            
-            # Handle parent_id - some APIs might send 0 or empty string instead of null
-            if parent_id in (0, '0', '', None):
-                parent_id = None
-            
-            cursor.execute("""
-                INSERT INTO categories (server_id, category_id, category_name, parent_id, content_type)
-                VALUES (?, ?, ?, ?, ?)
-            """, (server_id, category_id, category_name, parent_id, content_type))
-            
-            return True
-            
-        except sqlite3.Error as e:
-            logger.error(f"Error inserting category {category_data.get('category_name', 'Unknown')}: {e}")
-            return False
+    def insert_categories(self, rows: List[Tuple]) -> int:
+        """Insert a batch of (server_id, category_id, category_name, parent_id, content_type) rows, skipping existing ones"""
+        cursor = self._cur
+        # The schema's UNIQUE(server_id, category_id, content_type) skips rows that are already stored,
+        # so existing categories keep their name and visibility exactly as before
+        cursor.executemany("""
+            INSERT INTO categories (server_id, category_id, category_name, parent_id, content_type)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(server_id, category_id, content_type) DO NOTHING
+        """, rows)
+        return len(rows)
     
-    def process_categories_for_server(self, server: Dict) -> Tuple[int, int, int]:
-        """Process all category types for a single server"""
+    def process_categories_for_server(self, server: Dict, downloaded: Optional[Dict[str, List[Dict]]] = None) -> Tuple[int, int, int]:
+        """Process all category types for a single server, using already downloaded categories when given"""
         total_downloaded = 0
         total_new = 0
         total_existing = 0
         
-        content_types = ['live', 'vod', 'series']
-        
         try:
-            for content_type in content_types:
-                logger.info(f"Processing {content_type} categories for server: {server['name']}")
-                
-                categories = self.download_categories(server, content_type)
-                if not categories:
-                    logger.warning(f"No {content_type} categories found for server: {server['name']}")
-                    continue
-                
-                downloaded_count = len(categories)
-                new_count = 0
-                existing_count = 0
-                
-                # Process each category
-                for category_data in categories:
-                    if not isinstance(category_data, dict):
-                        logger.warning(f"Invalid category data format: {category_data}")
-                        continue
+            # One transaction for the whole server rather than one commit per content type
+            with self.conn:
+                for content_type in CONTENT_TYPES:
+                    logger.info(f"Processing {content_type} categories for server: {server['name']}")
                     
-                    category_id = category_data.get('category_id')
-                    if category_id is None:
-                        logger.warning(f"Category missing category_id: {category_data}")
+                    if downloaded is not None:
+                        categories = downloaded.get(content_type, [])
+                    else:
+                        categories, _ = self.download_categories(server, content_type)
+                    if not categories:
+                        logger.warning(f"No {content_type} categories found for server: {server['name']}")
                         continue
                     
-                    # Check if category already exists
-                    if self.category_exists(server['id'], category_id, content_type):
-                        existing_count += 1
-                        logger.debug(f"Category already exists: {category_data.get('category_name', 'Unknown')}")
-                        continue
+                    downloaded_count = len(categories)
+                    existing_ids = self.get_existing_category_ids(server['id'], content_type)
                     
-                    # Insert new category
-                    if self.insert_category(server['id'], category_data, content_type):
-                        new_count += 1
-                        logger.debug(f"Inserted new category: {category_data.get('category_name', 'Unknown')}")
-                
-                # Commit after each content type
-                self.conn.commit()
-                
-                logger.info(f"Server {server['name']} - {content_type}: {downloaded_count} downloaded, {new_count} new, {existing_count} existing")
-                
-                total_downloaded += downloaded_count
-                total_new += new_count
-                total_existing += existing_count
-                
-                # Small delay between requests to be respectful
-                time.sleep(1)
+                    # Drop malformed entries up front, then work column-wise on the rest
+                    valid = [c for c in categories if isinstance(c, dict) and c.get('category_id') is not None]
+                    if len(valid) < downloaded_count:
+                        logger.warning(f"Skipped {downloaded_count - len(valid)} malformed {content_type} categories from {server['name']}")
+                    
+                    ids = [c['category_id'] for c in valid]
+                    names = [c.get('category_name') or 'Unknown' for c in valid]
+                    # Some APIs send 0 or empty string instead of null for top-level categories
+                    parents = [None if c.get('parent_id') in (0, '0', '', None) else c['parent_id'] for c in valid]
+                    
+                    # Ids repeated within a feed are inserted once; later copies are skipped
+                    rows = [(server['id'], i, n, p, content_type) for i, n, p in zip(ids, names, parents)]
+                    new_count = len({str(i) for i in ids} - existing_ids)
+                    existing_count = len(valid) - new_count
+                    
+                    # Insert the new categories for this content type in one batch
+                    self.insert_categories(rows)
+                    
+                    logger.info(f"Server {server['name']} - {content_type}: {downloaded_count} downloaded, {new_count} new, {existing_count} existing")
+                    
+                    total_downloaded += downloaded_count
+                    total_new += new_count
+                    total_existing += existing_count
         
         except Exception as e:
             logger.error(f"Error processing categories for server {server['name']}: {e}")
@@ -454,53 +524,43 @@ class XtreamCategoriesDownloader:
             if cache_stats:
                 logger.info(f"Cache status: {cache_stats['valid_files']} valid files, {cache_stats['expired_files']} expired, {cache_stats['total_size_mb']} MB")
             
-            for i, server in enumerate(servers, 1):
-                logger.info(f"Processing server {i}/{total_servers}: {server['name']}")
-                
-                # Test server connection first (but only if we don't have valid cache for all content types)
-                content_types = ['live', 'vod', 'series']
-                has_all_cached = all(
-                    self._load_from_cache(self._generate_cache_key(server, ct)) is not None 
-                    for ct in content_types
-                )
-                
-                if not has_all_cached and not self.test_server_connection(server):
-                    logger.error(f"Skipping server {server['name']} due to connection issues")
-                    continue
-                
-                # Process categories for this server
-                downloaded, new, existing = self.process_categories_for_server(server)
-                
-                # Count cache hits vs API calls for this server
-                server_cache_hits = 0
-                server_api_calls = 0
-                
-                for content_type in content_types:
-                    cache_key = self._generate_cache_key(server, content_type)
-                    if self._load_from_cache(cache_key) is not None:
-                        server_cache_hits += 1
-                    else:
-                        server_api_calls += 1
-                
-                cache_hits += server_cache_hits
-                api_calls += server_api_calls
+            # Download every (server, content type) pair concurrently; network latency dominates.
+            # There is no separate connection test: an unreachable server simply yields no categories.
+            with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+                futures = {
+                    (server['id'], content_type): executor.submit(self.download_categories, server, content_type)
+                    for server in servers
+                    for content_type in CONTENT_TYPES
+                }
                 
-                if downloaded > 0:
-                    successful_servers += 1
-                    grand_total_downloaded += downloaded
-                    grand_total_new += new
-                    grand_total_existing += existing
+                # Write each server as soon as its downloads finish; the remaining downloads keep
+                # running in the pool meanwhile. SQLite stays on this thread.
+                for i, server in enumerate(servers, 1):
+                    logger.info(f"Processing server {i}/{total_servers}: {server['name']}")
                     
-                    cache_info = f"({server_cache_hits} cached, {server_api_calls} API calls)"
-                    logger.info(f"Server {server['name']} completed: {downloaded} total, {new} new, {existing} existing {cache_info}")
-                else:
-                    logger.warning(f"No categories downloaded from server: {server['name']}")
+                    # Process categories for this server
+                    results = {ct: futures[(server['id'], ct)].result() for ct in CONTENT_TYPES}
+                    server_categories = {ct: categories for ct, (categories, _) in results.items()}
+                    downloaded, new, existing = self.process_categories_for_server(server, server_categories)
+                    
+                    # Count cache hits vs API calls for this server
+                    server_cache_hits = sum(1 for _, was_cached in results.values() if was_cached)
+                    server_api_calls = len(results) - server_cache_hits
+                    
+                    cache_hits += server_cache_hits
+                    api_calls += server_api_calls
+                    
+                    if downloaded > 0:
+                        successful_servers += 1
+                        grand_total_downloaded += downloaded
+                        grand_total_new += new
+                        grand_total_existing += existing
+                        
+                        cache_info = f"({server_cache_hits} cached, {server_api_calls} API calls)"
+                        logger.info(f"Server {server['name']} completed: {downloaded} total, {new} new, {existing} existing {cache_info}")
+                    else:
+                        logger.warning(f"No categories downloaded from server: {server['name']}")
                 
-                # Shorter delay between servers when using cache
-                if i < total_servers:
-                    delay = 0.5 if server_cache_hits > 0 else 2
-                    time.sleep(delay)
-            
             # Final summary with cache statistics
             logger.info("="*70)
             logger.info("CATEGORY DOWNLOAD SUMMARY")
@@ -529,7 +589,7 @@ class XtreamCategoriesDownloader:
             return {}
         
         try:
-            cursor = self.conn.cursor()
+            cursor = self._cur
             
             stats = {}
             
@@ -1,15 +1,18 @@
 import sqlite3
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import logging
 import time
 import hashlib
-import pickle
 import urllib3
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 from urllib.parse import urljoin
 from datetime import datetime, timedelta
+from functools import lru_cache
+from itertools import islice
 
 # Disable SSL warnings for IPTV servers with invalid certificates
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -18,7 +21,44 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Secondary indexes on live_streams (as created by setupdb). They are dropped for an initial
+# import into an empty table and rebuilt once afterwards; the UNIQUE index is always kept.
+LIVE_SECONDARY_INDEXES = {
+    'idx_live_server_category': "CREATE INDEX IF NOT EXISTS idx_live_server_category ON live_streams(server_id, category_id)",
+    'idx_live_name': "CREATE INDEX IF NOT EXISTS idx_live_name ON live_streams(name)",
+    'idx_live_epg_channel': "CREATE INDEX IF NOT EXISTS idx_live_epg_channel ON live_streams(epg_channel_id)",
+}
+
+# UNIQUE(server_id, stream_id) lets SQLite drop existing streams itself
+INSERT_STREAM_SQL = """
+    INSERT OR IGNORE INTO live_streams (
+        server_id, category_id, stream_id, name, stream_type,
+        stream_icon, epg_channel_id, tv_archive, direct_source, tv_archive_duration, visible
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
+"""
+
+@lru_cache(maxsize=256)
+def _api_base_for(url: str, port, username: str, password: str) -> str:
+    """Build the player_api.php URL with credentials for a server (memoized)."""
+    base_url = url
+    if not base_url.startswith(('http://', 'https://')):
+        base_url = f"http://{base_url}"
+    if port not in [80, 443] and ':' not in base_url.split('://', 1)[1]:
+        base_url = f"{base_url}:{port}"
+    base_url = base_url.rstrip('/')
+    return f"{base_url}/player_api.php?username={username}&password={password}"
+
+@lru_cache(maxsize=512)
+def _cache_key_for(url: str, username: str, category_id: str) -> str:
+    """Hash server details and category into a cache key (memoized)."""
+    key_data = f"{url}_{username}_live_streams_{category_id}"
+    return hashlib.md5(key_data.encode()).hexdigest()
+
 class XtreamLiveStreamsDownloader:
+    # Rows per transaction: large enough to amortise commits, small enough to bound WAL growth
+    # and limit the work lost if an import fails part-way
+    BATCH_SIZE = 5000
+
     def __init__(self, db_path: str = None, cache_hours: int = 24):
         """Initialize the live streams downloader with caching support"""
         if db_path is None:
@@ -34,6 +74,11 @@ class XtreamLiveStreamsDownloader:
         self.session = requests.Session()
         self.session.timeout = 30
         self.session.verify = False
+        # Retry transient failures at the urllib3 layer, reusing pooled connections
+        retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504], allowed_methods=["GET"])
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         })
@@ -45,11 +90,10 @@ class XtreamLiveStreamsDownloader:
         logger.info("SSL verification disabled for IPTV server compatibility")
 
     def _generate_cache_key(self, server: Dict, category_id: str = "all") -> str:
-        key_data = f"{server['url']}_{server['username']}_live_streams_{category_id}"
-        return hashlib.md5(key_data.encode()).hexdigest()
+        return _cache_key_for(server['url'], server['username'], category_id)
 
     def _get_cache_file_path(self, cache_key: str) -> Path:
-        return self.cache_dir / f"{cache_key}.pkl"
+        return self.cache_dir / f"{cache_key}.json"
 
     def _is_cache_valid(self, cache_file: Path) -> bool:
         if not cache_file.exists():
@@ -58,15 +102,11 @@ class XtreamLiveStreamsDownloader:
         expiry_time = datetime.now() - timedelta(hours=self.cache_hours)
         return file_modified > expiry_time
 
-    def _save_to_cache(self, cache_key: str, data: List[Dict]) -> bool:
+    def _save_to_cache(self, cache_key: str, payload: bytes) -> bool:
+        """Store the raw JSON response body; the file's mtime is the cache timestamp."""
         try:
             cache_file = self._get_cache_file_path(cache_key)
-            cache_data = {
-                'timestamp': datetime.utcnow(),
-                'data': data
-            }
-            with open(cache_file, 'wb') as f:
-                pickle.dump(cache_data, f)
+            cache_file.write_bytes(payload)
             return True
         except Exception as e:
             logger.error(f"Error saving to cache {cache_key}: {e}")
@@ -77,20 +117,23 @@ class XtreamLiveStreamsDownloader:
             cache_file = self._get_cache_file_path(cache_key)
             if not self._is_cache_valid(cache_file):
                 return None
-            with open(cache_file, 'rb') as f:
-                cache_data = pickle.load(f)
-            return cache_data.get('data', [])
+            data = json.loads(cache_file.read_bytes())
+            return data if isinstance(data, list) else None
         except Exception as e:
             logger.warning(f"Error loading from cache {cache_key}: {e}")
             return None
 
     def _clear_expired_cache(self):
-        try:
-            for cache_file in self.cache_dir.glob("*.pkl"):
+        # Matches any extension so caches left by the old pickle format are purged too
+        for cache_file in self.cache_dir.glob("*"):
+            if not cache_file.is_file():
+                continue
+            try:
                 if not self._is_cache_valid(cache_file):
                     cache_file.unlink()
-        except Exception as e:
-            logger.warning(f"Error clearing expired cache: {e}")
+            except Exception as e:
+                # Keep sweeping; one unreadable entry shouldn't leave the rest behind
+                logger.warning(f"Error clearing expired cache file {cache_file.name}: {e}")
 
     def connect_db(self) -> bool:
         try:
@@ -99,6 +142,14 @@ class XtreamLiveStreamsDownloader:
                 return False
             self.conn = sqlite3.connect(self.db_path)
             self.conn.row_factory = sqlite3.Row
+            # WAL + NORMAL sync avoids an fsync per commit; keep temp data and hot pages in memory
+            self.conn.executescript("""
+                PRAGMA journal_mode=WAL;
+                PRAGMA synchronous=NORMAL;
+                PRAGMA temp_store=MEMORY;
+                PRAGMA mmap_size=268435456;
+                PRAGMA cache_size=-65536;
+            """)
             return True
         except sqlite3.Error as e:
             logger.error(f"Database connection error: {e}")
@@ -122,20 +173,12 @@ class XtreamLiveStreamsDownloader:
             return []
 
     def build_api_url(self, server: Dict, action: str = "", category_id: str = "") -> str:
-        base_url = server['url']
-        if not base_url.startswith(('http://', 'https://')):
-            base_url = f"http://{base_url}"
-        port = server.get('port', 80)
-        if port not in [80, 443] and ':' not in base_url.split('://', 1)[1]:
-            base_url = f"{base_url}:{port}"
-        base_url = base_url.rstrip('/')
-        api_url = f"{base_url}/player_api.php"
-        params = f"username={server['username']}&password={server['password']}"
+        url = _api_base_for(server['url'], server.get('port', 80), server['username'], server['password'])
         if action:
-            params += f"&action={action}"
+            url += f"&action={action}"
         if category_id:
-            params += f"&category_id={category_id}"
-        return f"{api_url}?{params}"
+            url += f"&category_id={category_id}"
+        return url
 
     def test_server_connection(self, server: Dict) -> bool:
         try:
@@ -157,9 +200,10 @@ class XtreamLiveStreamsDownloader:
             url = self.build_api_url(server, "get_live_streams", category_id)
             response = self.session.get(url, timeout=60, verify=False)
             response.raise_for_status()
-            streams = response.json()
+            streams = json.loads(response.content)
             if isinstance(streams, list):
-                self._save_to_cache(cache_key, streams)
+                # Cache the body as received; nothing is re-serialized
+                self._save_to_cache(cache_key, response.content)
                 return streams
             return []
         except Exception as e:
@@ -180,50 +224,36 @@ class XtreamLiveStreamsDownloader:
             logger.error(f"Error getting category mapping: {e}")
             return set()
 
-    def stream_exists(self, server_id: int, stream_id: int) -> bool:
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT 1 FROM live_streams WHERE server_id = ? AND stream_id = ?", (server_id, stream_id))
-            return cursor.fetchone() is not None
-        except sqlite3.Error as e:
-            logger.error(f"Error checking stream existence: {e}")
-            return False
-
-    def insert_stream(self, server_id: int, stream_data: Dict, existing_categories: set) -> bool:
-        try:
-            cursor = self.conn.cursor()
-            stream_id = stream_data.get('stream_id')
-            if stream_id is None:
-                return False
-
-            name = stream_data.get('name', 'Unknown')
-            stream_type = stream_data.get('stream_type', 'live')
-            stream_icon = stream_data.get('stream_icon', '')
-            epg_channel_id = stream_data.get('epg_channel_id', '')
-            tv_archive = stream_data.get('tv_archive', 0)
-            direct_source = stream_data.get('direct_source', '')
-            tv_archive_duration = stream_data.get('tv_archive_duration', 0)
-            category_id = str(stream_data.get('category_id', ''))
-
-            # Ensure the category exists before inserting
-            if category_id not in existing_categories:
-                logger.warning(f"Category ID {category_id} not found for stream {name}. Skipping.")
-                return False
+    def build_stream_row(self, server_id: int, stream_data: Dict, existing_categories: set) -> Optional[Tuple]:
+        """Turn one API stream into an INSERT_STREAM_SQL parameter tuple, or None if it can't be stored."""
+        if not isinstance(stream_data, dict):
+            return None
+        stream_id = stream_data.get('stream_id')
+        if stream_id is None:
+            return None
 
-            cursor.execute("""
-                INSERT INTO live_streams (
-                    server_id, category_id, stream_id, name, stream_type,
-                    stream_icon, epg_channel_id, tv_archive, direct_source, tv_archive_duration, visible
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
-            """, (
-                server_id, category_id, stream_id, name, stream_type,
-                stream_icon, epg_channel_id, tv_archive, direct_source, tv_archive_duration
-            ))
+        name = stream_data.get('name') or 'Unknown'
+        category_id = str(stream_data.get('category_id', ''))
+        # Ensure the category exists before inserting
+        if category_id not in existing_categories:
+            logger.warning(f"Category ID {category_id} not found for stream {name}. Skipping.")
+            return None
 
-            return True
-        except sqlite3.Error as e:
-            logger.error(f"Error inserting stream {stream_data.get('name', 'Unknown')}: {e}")
-            return False
+        return (
+            server_id, category_id, stream_id, name,
+            stream_data.get('stream_type', 'live'),
+            stream_data.get('stream_icon', ''),
+            stream_data.get('epg_channel_id', ''),
+            stream_data.get('tv_archive', 0),
+            stream_data.get('direct_source', ''),
+            stream_data.get('tv_archive_duration', 0)
+        )
+
+    def insert_streams(self, rows: Iterable[Tuple]) -> int:
+        """Insert a batch of live_streams rows, skipping ones already stored; returns the number added."""
+        cursor = self.conn.cursor()
+        cursor.executemany(INSERT_STREAM_SQL, rows)
+        return cursor.rowcount
 
     def process_streams_for_server(self, server: Dict) -> Tuple[int, int, int]:
         total_downloaded, total_new, total_existing = 0, 0, 0
@@ -233,18 +263,27 @@ class XtreamLiveStreamsDownloader:
             if not streams:
                 return 0, 0, 0
 
-            for stream_data in streams:
-                if not isinstance(stream_data, dict):
-                    continue
-                stream_id = stream_data.get('stream_id')
-                if stream_id is None:
-                    continue
-                if self.stream_exists(server['id'], stream_id):
-                    total_existing += 1
-                    continue
-                if self.insert_stream(server['id'], stream_data, existing_categories):
-                    total_new += 1
-            self.conn.commit()
+            # Rows are produced lazily and consumed in fixed-size batches, so no second
+            # full-size copy of the channel list is built alongside the parsed JSON
+            queued = 0
+
+            def stream_rows():
+                nonlocal queued
+                for stream_data in streams:
+                    row = self.build_stream_row(server['id'], stream_data, existing_categories)
+                    if row is not None:
+                        queued += 1
+                        yield row
+
+            # Commit every BATCH_SIZE rows
+            rows = stream_rows()
+            while True:
+                batch = list(islice(rows, self.BATCH_SIZE))
+                if not batch:
+                    break
+                with self.conn:
+                    total_new += self.insert_streams(batch)
+            total_existing = queued - total_new
             total_downloaded = len(streams)
         except Exception as e:
             logger.error(f"Error processing streams for server {server['name']}: {e}")
@@ -259,8 +298,21 @@ class XtreamLiveStreamsDownloader:
             servers = self.get_servers()
             if not servers:
                 return False
-            for server in servers:
-                self.process_streams_for_server(server)
+
+            # On a first import every row is new, so build the secondary indexes once at the end
+            # instead of updating three b-trees per insert. Incremental runs keep them in place.
+            if self.conn.execute("SELECT 1 FROM live_streams LIMIT 1").fetchone() is None:
+                for index_name in LIVE_SECONDARY_INDEXES:
+                    self.conn.execute(f"DROP INDEX IF EXISTS {index_name}")
+            try:
+                for server in servers:
+                    self.process_streams_for_server(server)
+            finally:
+                # Always (re)create them: a no-op when present, and it repairs a bulk load that was
+                # killed before reaching this point, which would otherwise leave the table unindexed
+                with self.conn:
+                    for create_sql in LIVE_SECONDARY_INDEXES.values():
+                        self.conn.execute(create_sql)
             return True
         finally:
             self.close_db()
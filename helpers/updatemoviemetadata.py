@@ -1,9 +1,15 @@
 import sqlite3
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import logging
 import time
-import pickle
+import json
+import hashlib
 import threading
+import queue
+import atexit
+import shutil
 from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
@@ -14,15 +20,23 @@ logger = logging.getLogger(__name__)
 
 # Paths
 DB_PATH = Path(__file__).parent.parent / "database" / "media_player.db"
-CACHE_DIR = DB_PATH.parent / "cache" / "movie_metadata"
-CACHE_DIR.mkdir(parents=True, exist_ok=True)
+# All cached API responses live in one SQLite file rather than one pickle per movie
+CACHE_DB = DB_PATH.parent / "cache" / "movie_metadata.db"
+CACHE_DB.parent.mkdir(parents=True, exist_ok=True)
+# One pickle per movie, replaced by CACHE_DB; removed on the next run
+LEGACY_CACHE_DIR = DB_PATH.parent / "cache" / "movie_metadata"
 CACHE_EXPIRY = 24 * 60 * 60  # 24 hours in seconds
 
-# Rate limit (seconds between API requests)
+# Rate limit (average seconds between API requests to one server, shared by all workers)
 RATE_LIMIT_DELAY = 0.02
 
-# Thread pool size for fetching metadata
-THREAD_WORKERS = 8
+# Thread pool size for fetching metadata. Workers spend nearly all their time waiting on the
+# network (database writes live on the writer thread), so this can sit well above the CPU count.
+THREAD_WORKERS = 32
+
+# The writer thread commits after this many queued updates or this many seconds, whichever comes first
+WRITE_BATCH_SIZE = 500
+WRITE_BATCH_SECONDS = 0.1
 
 
 
@@ -34,98 +48,244 @@ UPDATE_COLUMNS = [
     "backdrop_path", "bitrate", "status", "runtime"
 ]
 
+# Updates are staged in a temp table and applied with one UPDATE per batch.
+# meta_hash records what was written so an unchanged API response can be skipped next time.
+# Column names are quoted because "cast" is an SQL keyword.
+_QUOTED_COLUMNS = ', '.join(f'"{key}"' for key in UPDATE_COLUMNS + ["meta_hash"])
+STAGE_TABLE_SQL = f"CREATE TEMP TABLE IF NOT EXISTS meta_updates (stream_id INTEGER PRIMARY KEY, {_QUOTED_COLUMNS})"
+STAGE_SQL = f"INSERT OR REPLACE INTO meta_updates ({_QUOTED_COLUMNS}, stream_id) VALUES ({', '.join('?' * (len(UPDATE_COLUMNS) + 2))})"
+UPDATE_SQL = f"""
+    UPDATE vod_streams SET ({_QUOTED_COLUMNS}) = (
+        SELECT {_QUOTED_COLUMNS} FROM meta_updates WHERE meta_updates.stream_id = vod_streams.stream_id
+    )
+    WHERE stream_id IN (SELECT stream_id FROM meta_updates)
+"""
+
+def _connect(db_path):
+    """Open the database in autocommit mode with the bulk-update PRAGMAs applied once."""
+    conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-65536")
+    conn.execute("PRAGMA mmap_size=268435456")
+    return conn
+
+# Per worker thread: a keep-alive HTTP session (so repeat requests reuse the connection) and a cache connection
+_thread_local = threading.local()
+_open_connections = set()
+_connections_lock = threading.Lock()
+
+def _get_session():
+    """Return this thread's pooled requests session, creating it on first use."""
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        # Transient failures are retried inside urllib3, on the same pooled connection where possible
+        retry = Retry(total=3, backoff_factor=1, status_forcelist=[500, 502, 503, 504], allowed_methods=["GET"])
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=retry)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers["Connection"] = "keep-alive"
+        _thread_local.session = session
+    return session
+
+class TokenBucket:
+    """Thread-safe token bucket: acquire() blocks until a request may be sent."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+# One bucket per server, so workers share that server's request budget
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+def _rate_limiter_for(server):
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(server['id'])
+        if limiter is None:
+            limiter = _rate_limiters[server['id']] = TokenBucket(1 / RATE_LIMIT_DELAY, THREAD_WORKERS)
+        return limiter
+
 def fetch_metadata_from_api(server, stream_id):
-    retries = 3
-    delay = 1  # initial delay in seconds
-    for i in range(retries):
-        try:
-            base_url = server['url'].strip()
-            if not base_url.startswith(('http://', 'https://')):
-                base_url = 'http://' + base_url
-            port = server.get('port', 80)
-            if port and port not in (80, 443) and ':' not in base_url.split('://', 1)[1]:
-                base_url = f"{base_url}:{port}"
-            base_url = base_url.rstrip('/')
-
-            url = f"{base_url}/player_api.php?username={server['username']}&password={server['password']}&action=get_vod_info&vod_id={stream_id}"
-            
-            logger.debug(f"Attempt {i+1}/{retries} to fetch metadata for stream_id {stream_id} from {url}")
-            response = requests.get(url, timeout=30, verify=False)
-            response.raise_for_status()
-            
-            json_response = response.json()
-            if isinstance(json_response, list):
-                logger.warning(f"API response for stream_id {stream_id} is a list, expected a dictionary. Response: {json_response}")
-                return None
-            return json_response
-        except requests.exceptions.RequestException as e:
-            logger.warning(f"Network error fetching metadata for stream_id {stream_id} (attempt {i+1}/{retries}): {e}")
-            if i < retries - 1:
-                time.sleep(delay)
-                delay *= 2 # Exponential backoff
-            else:
-                return None
-        except ValueError as e: # Catches JSON decoding errors
-            logger.warning(f"JSON decoding error for stream_id {stream_id} (attempt {i+1}/{retries}): {e}. Response text: {response.text}")
-            return None
-        except Exception as e:
-            logger.warning(f"An unexpected error occurred fetching metadata for stream_id {stream_id} (attempt {i+1}/{retries}): {e}")
+    base_url = server['url'].strip()
+    if not base_url.startswith(('http://', 'https://')):
+        base_url = 'http://' + base_url
+    port = server.get('port', 80)
+    if port and port not in (80, 443) and ':' not in base_url.split('://', 1)[1]:
+        base_url = f"{base_url}:{port}"
+    base_url = base_url.rstrip('/')
+
+    url = f"{base_url}/player_api.php?username={server['username']}&password={server['password']}&action=get_vod_info&vod_id={stream_id}"
+    response = None
+    try:
+        logger.debug(f"Fetching metadata for stream_id {stream_id} from {url}")
+        # Only real requests spend a token; retries with exponential backoff are handled by the session's adapter
+        _rate_limiter_for(server).acquire()
+        response = _get_session().get(url, timeout=30, verify=False)
+        response.raise_for_status()
+
+        json_response = response.json()
+        if isinstance(json_response, list):
+            logger.warning(f"API response for stream_id {stream_id} is a list, expected a dictionary. Response: {json_response}")
             return None
-    return None
+        return json_response
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Network error fetching metadata for stream_id {stream_id}: {e}")
+        return None
+    except ValueError as e: # Catches JSON decoding errors
+        logger.warning(f"JSON decoding error for stream_id {stream_id}: {e}. Response text: {response.text if response is not None else ''}")
+        return None
+    except Exception as e:
+        logger.warning(f"An unexpected error occurred fetching metadata for stream_id {stream_id}: {e}")
+        return None
+
+def _get_cache_conn():
+    """Return this thread's connection to the metadata cache database."""
+    conn = getattr(_thread_local, "cache_conn", None)
+    if conn is None or conn not in _open_connections:
+        conn = sqlite3.connect(CACHE_DB, timeout=30, isolation_level=None, check_same_thread=False)
+        # Entries can always be re-fetched, so don't pay for durability
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (id INTEGER PRIMARY KEY, ts INTEGER, blob BLOB)")
+        # Movies the API had no usable metadata for; skipped until the entry expires
+        conn.execute("CREATE TABLE IF NOT EXISTS failures (id INTEGER PRIMARY KEY, ts INTEGER)")
+        with _connections_lock:
+            _open_connections.add(conn)
+        _thread_local.cache_conn = conn
+    return conn
+
+def _close_connections():
+    """Close every thread's cache connection; threads reopen one on their next _get_cache_conn call."""
+    with _connections_lock:
+        for conn in _open_connections:
+            conn.close()
+        _open_connections.clear()
+
+atexit.register(_close_connections)
+
+def remove_legacy_cache():
+    """Delete the per-movie pickle cache left behind by older versions."""
+    if LEGACY_CACHE_DIR.is_dir():
+        try:
+            shutil.rmtree(LEGACY_CACHE_DIR)
+            logger.info(f"Removed legacy movie metadata cache directory {LEGACY_CACHE_DIR}")
+        except OSError as e:
+            logger.warning(f"Failed to remove legacy movie metadata cache directory: {e}")
 
 def load_cache(stream_id):
-    cache_file = CACHE_DIR / f"{stream_id}.pkl"
-    if cache_file.exists():
-        try:
-            # Check if cache has expired
-            if time.time() - cache_file.stat().st_mtime > CACHE_EXPIRY:
-                return None
-            with open(cache_file, "rb") as f:
-                return pickle.load(f)
-        except Exception:
+    try:
+        row = _get_cache_conn().execute("SELECT blob, ts FROM meta WHERE id=?", (stream_id,)).fetchone()
+        # Check if cache has expired
+        if row is None or time.time() - row[1] > CACHE_EXPIRY:
             return None
-    return None
+        return json.loads(row[0])
+    except Exception:
+        return None
 
 def save_cache(stream_id, data):
-    cache_file = CACHE_DIR / f"{stream_id}.pkl"
     try:
-        with open(cache_file, "wb") as f:
-            pickle.dump(data, f)
+        _get_cache_conn().execute(
+            "INSERT OR REPLACE INTO meta (id, ts, blob) VALUES (?, ?, ?)",
+            (stream_id, int(time.time()), json.dumps(data).encode())
+        )
     except Exception as e:
         logger.warning(f"Failed to save cache for stream_id {stream_id}: {e}")
 
+def record_failure(stream_id):
+    try:
+        _get_cache_conn().execute(
+            "INSERT OR REPLACE INTO failures (id, ts) VALUES (?, ?)", (stream_id, int(time.time()))
+        )
+    except Exception as e:
+        logger.warning(f"Failed to record fetch failure for stream_id {stream_id}: {e}")
+
+def get_recent_failures():
+    """Return the stream_ids whose last fetch failed within CACHE_EXPIRY, in one query."""
+    try:
+        cutoff = int(time.time() - CACHE_EXPIRY)
+        return {row[0] for row in _get_cache_conn().execute("SELECT id FROM failures WHERE ts >= ?", (cutoff,))}
+    except Exception as e:
+        logger.warning(f"Error loading recent fetch failures: {e}")
+        return set()
+
+def clear_expired_cache():
+    try:
+        cutoff = int(time.time() - CACHE_EXPIRY)
+        conn = _get_cache_conn()
+        conn.execute("DELETE FROM failures WHERE ts < ?", (cutoff,))
+        deleted = conn.execute("DELETE FROM meta WHERE ts < ?", (cutoff,)).rowcount
+        if deleted:
+            logger.info(f"Removed {deleted} expired movie metadata cache entries")
+    except Exception as e:
+        logger.warning(f"Error clearing expired cache: {e}")
+
+def ensure_meta_hash_column(db_path):
+    """Add vod_streams.meta_hash to databases created before it existed."""
+    conn = _connect(db_path)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(vod_streams)")]
+    if "meta_hash" not in columns:
+        conn.execute("ALTER TABLE vod_streams ADD COLUMN meta_hash TEXT")
+    conn.close()
+
 def get_movies(db_path):
-    conn = sqlite3.connect(db_path)
+    conn = _connect(db_path)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
-    cursor.execute("SELECT stream_id, server_id FROM vod_streams WHERE tmdb_id IS NULL OR tmdb_id=''")
+    cursor.execute("SELECT stream_id, server_id, meta_hash FROM vod_streams WHERE tmdb_id IS NULL OR tmdb_id=''")
     movies = cursor.fetchall()
     conn.close()
     return movies
 
-def get_server_info(db_path, server_id):
-    conn = sqlite3.connect(db_path)
+def get_servers(db_path):
+    """Load every server once, keyed by id."""
+    conn = _connect(db_path)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM servers WHERE id=?", (server_id,))
-    row = cursor.fetchone()
+    cursor.execute("SELECT * FROM servers")
+    servers = {row["id"]: dict(row) for row in cursor.fetchall()}
     conn.close()
-    return dict(row) if row else None
+    return servers
 
-def normalize_value(value, key):
-    """Convert lists to comma-separated strings, None to empty strings (except integers)."""
+def _to_text(value):
+    """Convert lists to comma-separated strings and None to an empty string."""
     if isinstance(value, list):
         return ', '.join(str(v) for v in value)
-    if value is None:
-        if key in ["duration_secs", "bitrate"]:
-            return 0
-        return ''
-    return value
+    return '' if value is None else value
+
+def _to_int(value):
+    """Like _to_text, but None becomes 0 for integer columns."""
+    if isinstance(value, list):
+        return ', '.join(str(v) for v in value)
+    return 0 if value is None else value
+
+# Converter per column, resolved once at import so the per-movie loop does no key checks
+COLUMN_CONVERTERS = [
+    (key, _to_int if key in ("duration_secs", "bitrate") else _to_text) for key in UPDATE_COLUMNS
+]
 
-def update_movie(db_path, stream_id, metadata, db_lock):
+def build_update_params(stream_id, metadata):
+    """Flatten API metadata into the STAGE_SQL parameter tuple, or None if it is unusable."""
     if not isinstance(metadata, dict):
         logger.error(f"Unexpected metadata type for stream_id {stream_id}: {type(metadata)}. Value: {metadata}")
-        return 0
+        return None
     info = metadata.get("info", {})
     movie_data = metadata.get("movie_data", {})
     flattened = {**info, **movie_data}
@@ -134,34 +294,52 @@ def update_movie(db_path, stream_id, metadata, db_lock):
     if "releasedate" in flattened:
         flattened["release_date"] = flattened.pop("releasedate")
 
-    set_clauses = []
-    params = []
-
-    for key in UPDATE_COLUMNS:
-        value = normalize_value(flattened.get(key), key)
-        set_clauses.append(f"{key}=?")
-        params.append(value)
-
-    if not set_clauses:
-        logger.warning(f"No columns to update for stream_id {stream_id}")
-        return 0
-
-    params.append(stream_id)
-    sql_query = f"UPDATE vod_streams SET {', '.join(set_clauses)} WHERE stream_id=?"
+    # Pack straight into the final tuple with the dict lookup bound once
+    get = flattened.get
+    values = tuple([convert(get(key)) for key, convert in COLUMN_CONVERTERS])
+    meta_hash = hashlib.md5(json.dumps(values, default=str).encode()).hexdigest()
+    return values + (meta_hash, stream_id)
+
+def db_writer(db_path, write_queue, result):
+    """Apply queued updates on one connection, committing them in batches until a None sentinel arrives."""
+    conn = _connect(db_path)
+    conn.execute(STAGE_TABLE_SQL)
+    stopping = False
+    while not stopping:
+        batch = []
+        item = write_queue.get()
+        deadline = time.monotonic() + WRITE_BATCH_SECONDS
+        while True:
+            if item is None:
+                stopping = True
+                break
+            batch.append(item)
+            if len(batch) >= WRITE_BATCH_SIZE:
+                break
+            try:
+                item = write_queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
 
-    with db_lock:
-        conn = sqlite3.connect(db_path)
-        conn.execute("PRAGMA journal_mode=WAL") # Add WAL mode for better concurrency
-        cursor = conn.cursor()
-        cursor.execute(sql_query, params)
-        conn.commit()
-        conn.close()
-    return cursor.rowcount
+        if not batch:
+            continue
+        try:
+            conn.execute("BEGIN")
+            conn.executemany(STAGE_SQL, batch)
+            updated = conn.execute(UPDATE_SQL).rowcount
+            conn.execute("DELETE FROM meta_updates")
+            conn.commit()
+            result["updated"] += updated
+        except sqlite3.Error as e:
+            logger.error(f"Error writing batch of {len(batch)} movie updates: {e}")
+            if conn.in_transaction:
+                conn.rollback()
+    conn.close()
 
 # Moved process_movie outside main()
-def process_movie(index, movie_tuple, total_movies, db_lock):
-    stream_id, server_id = movie_tuple
-    server = get_server_info(DB_PATH, server_id) # DB_PATH is global
+def process_movie(index, movie_tuple, total_movies, servers, write_queue):
+    stream_id, server_id, known_hash = movie_tuple
+    server = servers.get(server_id)
     if not server:
         logger.warning(f"Server {server_id} not found, skipping stream_id {stream_id}")
         return 0
@@ -175,39 +353,71 @@ def process_movie(index, movie_tuple, total_movies, db_lock):
         metadata = fetch_metadata_from_api(server, stream_id)
         if metadata: # metadata from API is already checked for dict type
             save_cache(stream_id, metadata)
-        time.sleep(RATE_LIMIT_DELAY)
+        else:
+            record_failure(stream_id)
 
     if metadata: # Now metadata is guaranteed to be a dict or None
-        if not isinstance(metadata, dict):
-            logger.error(f"Unexpected metadata type for stream_id {stream_id}: {type(metadata)}. Value: {metadata}")
+        params = build_update_params(stream_id, metadata)
+        if params is None:
             return 0 # Skip update if type is incorrect
-        updated = update_movie(DB_PATH, stream_id, metadata, db_lock)
-        print(f"[{index}/{total_movies}] Updated stream_id {stream_id}" if updated else f"[{index}/{total_movies}] No update applied for stream_id {stream_id}", flush=True)
-        return updated
+        if params[-2] == known_hash:
+            print(f"[{index}/{total_movies}] Metadata unchanged for stream_id {stream_id}", flush=True)
+            return 0
+        # The single writer thread owns all database writes
+        write_queue.put(params)
+        print(f"[{index}/{total_movies}] Queued update for stream_id {stream_id}", flush=True)
+        return 1
     else:
         print(f"[{index}/{total_movies}] No metadata available for stream_id {stream_id}", flush=True)
         return 0
 
 def main():
     logger.info("Starting movie metadata update")
+    remove_legacy_cache()
+    try:
+        return _run()
+    finally:
+        # The GUI's worker thread outlives this call, and Clear Cache may delete CACHE_DB next
+        _close_connections()
+
+def _run():
+    clear_expired_cache()
+    ensure_meta_hash_column(DB_PATH)
 
     movies = get_movies(DB_PATH)
+    # Don't re-request movies the API recently failed to describe
+    recent_failures = get_recent_failures()
+    if recent_failures:
+        pending = [movie for movie in movies if movie["stream_id"] not in recent_failures]
+        if len(pending) < len(movies):
+            logger.info(f"Skipping {len(movies) - len(pending)} movies whose metadata fetch failed recently")
+        movies = pending
     total_movies = len(movies)
+    servers = get_servers(DB_PATH)
     print(f"Found {total_movies} movies without TMDB ID", flush=True)
 
-    total_updated = 0
     has_errors = False
-    db_lock = threading.Lock()
+    write_queue = queue.Queue()
+    writer_result = {"updated": 0}
+    writer = threading.Thread(target=db_writer, args=(DB_PATH, write_queue, writer_result), name="movie-metadata-writer")
+    writer.start()
 
-    with ThreadPoolExecutor(max_workers=THREAD_WORKERS) as executor:
-        # Pass total_movies to process_movie
-        futures = {executor.submit(process_movie, i+1, movie, total_movies, db_lock): movie for i, movie in enumerate(movies)}
-        for future in as_completed(futures):
-            try:
-                total_updated += future.result()
-            except Exception as e:
-                logger.error(f"Error processing movie: {e}")
-                has_errors = True
+    try:
+        with ThreadPoolExecutor(max_workers=THREAD_WORKERS) as executor:
+            # Pass total_movies to process_movie
+            futures = {executor.submit(process_movie, i+1, movie, total_movies, servers, write_queue): movie for i, movie in enumerate(movies)}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"Error processing movie: {e}")
+                    has_errors = True
+    finally:
+        # Sentinel: flush whatever is left and stop the writer
+        write_queue.put(None)
+        writer.join()
+
+    total_updated = writer_result["updated"]
 
     print(f"Movie metadata update completed: total updated {total_updated}", flush=True)
 
@@ -2,13 +2,20 @@ import sqlite3
 import requests
 import json
 import logging
+import os
 import time
 import hashlib
-import pickle
+import re
 import urllib3
+from calendar import monthrange
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
-from datetime import datetime, timedelta
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from functools import lru_cache
 
 # Disable SSL warnings for IPTV servers with invalid certificates
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -17,7 +24,52 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Server downloads are pure network I/O, so fetch them concurrently
+DOWNLOAD_WORKERS = 8
+
+# Hash of the last catalogue imported per server; an unchanged catalogue skips the insert pass
+SYNC_STATE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS sync_state (
+        server_id INTEGER,
+        content_type TEXT,
+        content_hash TEXT,
+        synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (server_id, content_type),
+        FOREIGN KEY (server_id) REFERENCES servers (id) ON DELETE CASCADE
+    )
+"""
+
+# Date layouts seen in VOD data: YYYY-MM-DD[ HH:MM:SS], YYYY, DD-MM-YYYY and MM/DD/YYYY
+_DATE_RE = re.compile(
+    r'(\d{4})-(\d{1,2})-(\d{1,2})(?: \d{1,2}:\d{1,2}:\d{1,2})?'
+    r'|(\d{4})'
+    r'|(\d{1,2})-(\d{1,2})-(\d{4})'
+    r'|(\d{1,2})/(\d{1,2})/(\d{4})'
+)
+# [HH:]MM:SS
+_HMS_RE = re.compile(r'(?:(\d+):)?(\d+):(\d+)')
+
+# Prepared once and reused by executemany for every batch; the unique
+# (server_id, stream_id) index lets SQLite skip streams that are already stored
+INSERT_STREAM_SQL = """
+    INSERT OR IGNORE INTO vod_streams (
+        server_id, category_id, stream_id, name, stream_icon, rating, rating_5based,
+        added, container_extension, custom_sid, direct_source, plot, cast, director,
+        genre, release_date, duration_secs, duration, video_quality
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+@lru_cache(maxsize=512)
+def _cache_key_for(url: str, username: str, category_id: str) -> str:
+    """Hash server details and category into a cache key (memoized)"""
+    key_data = f"{url}_{username}_vod_streams_{category_id}".encode()
+    return hashlib.blake2b(key_data, digest_size=16).hexdigest()
+
 class XtreamVODStreamsDownloader:
+    # Rows written per transaction
+    BATCH_SIZE = 1000
+
     def __init__(self, db_path: str = None, cache_hours: int = 24):
         """Initialize the VOD streams downloader with caching support"""
         if db_path is None:
@@ -34,6 +86,11 @@ class XtreamVODStreamsDownloader:
         self.session = requests.Session()
         self.session.timeout = 30
         self.session.verify = False  # Disable SSL verification for IPTV servers
+        # Retry transient failures with exponential backoff, reusing pooled connections
+        retry = Retry(total=3, backoff_factor=1, status_forcelist=[500, 502, 503, 504], allowed_methods=["GET"])
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=64, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
         
         # Set user agent to avoid blocking
         self.session.headers.update({
@@ -48,42 +105,32 @@ class XtreamVODStreamsDownloader:
     
     def _generate_cache_key(self, server: Dict, category_id: str = "all") -> str:
         """Generate a unique cache key for server + category combination"""
-        key_data = f"{server['url']}_{server['username']}_vod_streams_{category_id}"
-        return hashlib.md5(key_data.encode()).hexdigest()
+        return _cache_key_for(server['url'], server['username'], category_id)
     
     def _get_cache_file_path(self, cache_key: str) -> Path:
         """Get the cache file path for a given cache key"""
-        return self.cache_dir / f"{cache_key}.pkl"
+        return self.cache_dir / f"{cache_key}.json"
     
-    def _is_cache_valid(self, cache_file: Path) -> bool:
+    def _cache_cutoff(self) -> float:
+        """Epoch time before which a cache file counts as expired"""
+        return time.time() - self.cache_hours * 3600
+    
+    def _is_cache_valid(self, cache_file: Path, cutoff: Optional[float] = None) -> bool:
         """Check if cache file exists and is not older than cache_hours"""
-        if not cache_file.exists():
+        if cutoff is None:
+            cutoff = self._cache_cutoff()
+        try:
+            return cache_file.stat().st_mtime > cutoff
+        except FileNotFoundError:
             return False
-        
-        file_modified = datetime.fromtimestamp(cache_file.stat().st_mtime)
-        expiry_time = datetime.now() - timedelta(hours=self.cache_hours)
-        
-        is_valid = file_modified > expiry_time
-        if is_valid:
-            logger.debug(f"Cache valid: {cache_file.name} (modified: {file_modified})")
-        else:
-            logger.debug(f"Cache expired: {cache_file.name} (modified: {file_modified}, expires after: {expiry_time})")
-        
-        return is_valid
     
-    def _save_to_cache(self, cache_key: str, data: List[Dict]) -> bool:
-        """Save API response data to cache"""
+    def _save_to_cache(self, cache_key: str, payload: bytes) -> bool:
+        """Save the raw JSON response body to cache; the file's mtime is the cache timestamp"""
         try:
             cache_file = self._get_cache_file_path(cache_key)
-            cache_data = {
-                'timestamp': datetime.now(),
-                'data': data
-            }
+            cache_file.write_bytes(payload)
             
-            with open(cache_file, 'wb') as f:
-                pickle.dump(cache_data, f)
-            
-            logger.debug(f"Saved {len(data)} items to cache: {cache_file.name}")
+            logger.debug(f"Saved {len(payload)} bytes to cache: {cache_file.name}")
             return True
             
         except Exception as e:
@@ -98,13 +145,11 @@ class XtreamVODStreamsDownloader:
             if not self._is_cache_valid(cache_file):
                 return None
             
-            with open(cache_file, 'rb') as f:
-                cache_data = pickle.load(f)
-            
-            data = cache_data.get('data', [])
-            timestamp = cache_data.get('timestamp')
+            data = json.loads(cache_file.read_bytes())
+            if not isinstance(data, list):
+                return None
             
-            logger.info(f"Loaded {len(data)} items from cache: {cache_file.name} (cached: {timestamp})")
+            logger.info(f"Loaded {len(data)} items from cache: {cache_file.name}")
             return data
             
         except Exception as e:
@@ -115,11 +160,14 @@ class XtreamVODStreamsDownloader:
         """Remove expired cache files"""
         try:
             expired_count = 0
-            for cache_file in self.cache_dir.glob("*.pkl"):
-                if not self._is_cache_valid(cache_file):
-                    cache_file.unlink()
-                    expired_count += 1
-                    logger.debug(f"Removed expired cache file: {cache_file.name}")
+            cutoff = self._cache_cutoff()
+            # Matches any extension so caches left by the old pickle format are purged too
+            with os.scandir(self.cache_dir) as entries:
+                for entry in entries:
+                    if entry.is_file(follow_symlinks=False) and entry.stat(follow_symlinks=False).st_mtime <= cutoff:
+                        os.unlink(entry.path)
+                        expired_count += 1
+                        logger.debug(f"Removed expired cache file: {entry.name}")
             
             if expired_count > 0:
                 logger.info(f"Cleaned up {expired_count} expired cache files")
@@ -130,16 +178,26 @@ class XtreamVODStreamsDownloader:
     def get_cache_stats(self) -> Dict:
         """Get cache statistics"""
         try:
-            cache_files = list(self.cache_dir.glob("*.pkl"))
-            valid_files = [f for f in cache_files if self._is_cache_valid(f)]
-            expired_files = [f for f in cache_files if not self._is_cache_valid(f)]
+            cutoff = self._cache_cutoff()
+            total_files = valid_files = expired_files = total_size = 0
             
-            total_size = sum(f.stat().st_size for f in cache_files)
+            # Single scandir pass, one stat() per file
+            with os.scandir(self.cache_dir) as entries:
+                for entry in entries:
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                    total_files += 1
+                    total_size += st.st_size
+                    if st.st_mtime > cutoff:
+                        valid_files += 1
+                    else:
+                        expired_files += 1
             
             return {
-                'total_files': len(cache_files),
-                'valid_files': len(valid_files),
-                'expired_files': len(expired_files),
+                'total_files': total_files,
+                'valid_files': valid_files,
+                'expired_files': expired_files,
                 'total_size_bytes': total_size,
                 'total_size_mb': round(total_size / 1024 / 1024, 2),
                 'cache_directory': str(self.cache_dir)
@@ -158,12 +216,39 @@ class XtreamVODStreamsDownloader:
                 
             self.conn = sqlite3.connect(self.db_path)
             self.conn.row_factory = sqlite3.Row  # Enable dict-like access
+            # WAL + NORMAL sync avoids an fsync per batch commit; keep temp data and hot pages in memory.
+            # WAL mode leaves media_player.db-wal and -shm files next to the database.
+            self.conn.executescript("""
+                PRAGMA journal_mode=WAL;
+                PRAGMA synchronous=NORMAL;
+                PRAGMA temp_store=MEMORY;
+                PRAGMA mmap_size=268435456;
+                PRAGMA cache_size=-65536;
+                PRAGMA wal_autocheckpoint=1000;
+            """)
+            self.ensure_unique_stream_index()
+            self.conn.execute(SYNC_STATE_TABLE_SQL)
             logger.info(f"Connected to database: {self.db_path}")
             return True
         except sqlite3.Error as e:
             logger.error(f"Database connection error: {e}")
             return False
     
+    def ensure_unique_stream_index(self):
+        """Create the unique (server_id, stream_id) index on databases that predate it"""
+        indexes = {row['name'] for row in self.conn.execute("PRAGMA index_list(vod_streams)")}
+        if 'idx_vod_unique_stream' in indexes:
+            return
+        with self.conn:
+            # Older imports could store the same stream twice; keep the first copy of each
+            removed = self.conn.execute("""
+                DELETE FROM vod_streams WHERE id NOT IN (
+                    SELECT MIN(id) FROM vod_streams GROUP BY server_id, stream_id
+                )
+            """).rowcount
+            self.conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_vod_unique_stream ON vod_streams(server_id, stream_id)")
+        logger.info(f"Created unique VOD stream index, removed {removed} duplicate streams")
+    
     def close_db(self):
         """Close database connection"""
         if self.conn:
@@ -281,13 +366,13 @@ class XtreamVODStreamsDownloader:
             response = self.session.get(url, timeout=90, verify=False)  # Longer timeout for large VOD lists
             response.raise_for_status()
             
-            streams = response.json()
+            streams = json.loads(response.content)
             
             if isinstance(streams, list):
                 logger.info(f"Downloaded {len(streams)} VOD streams from {server['name']}{category_info}")
                 
-                # Save to cache
-                if self._save_to_cache(cache_key, streams):
+                # Cache the body as received; nothing is re-serialized
+                if self._save_to_cache(cache_key, response.content):
                     logger.debug(f"Cached VOD streams for {server['name']}{category_info}")
                 
                 return streams
@@ -312,119 +397,89 @@ class XtreamVODStreamsDownloader:
             logger.error(f"Unexpected error downloading VOD streams from {server['name']}: {e}")
             return []
     
-    def get_category_mapping(self, server_id: int) -> Dict[int, int]:
-        """Get category ID mapping from database for VOD content (keys are integers)"""
+    def get_category_mapping(self, server_id: int) -> Dict:
+        """Get category ID mapping from database for VOD content (keyed by both int and str ids)"""
         try:
             cursor = self.conn.cursor()
             cursor.execute("""
                 SELECT category_id, id FROM categories 
                 WHERE server_id = ? AND content_type = 'vod'
             """, (server_id,))
-            # Keep integer keys to match API category_id as integer
-            mapping = {int(row['category_id']): row['id'] for row in cursor.fetchall()}
-            logger.info(f"Category mapping for server {server_id}: {mapping}")
+            rows = cursor.fetchall()
+            # The API sends category_id as either int or str; key both forms so lookups need no conversion
+            mapping = {str(row['category_id']): row['id'] for row in rows}
+            mapping.update({int(key): value for key, value in mapping.items() if key.isdigit()})
+            # Count the rows, not the mapping, which holds most categories under two keys
+            logger.info(f"Found {len(rows)} VOD categories for server {server_id}")
+            logger.debug(f"Category mapping for server {server_id}: {mapping}")
             return mapping
         except sqlite3.Error as e:
             logger.error(f"Error getting category mapping: {e}")
             return {}
     
-    def stream_exists(self, server_id: int, stream_id: int) -> bool:
-        """Check if VOD stream already exists in database"""
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute("""
-                SELECT 1 FROM vod_streams 
-                WHERE server_id = ? AND stream_id = ?
-            """, (server_id, stream_id))
-            return cursor.fetchone() is not None
-        except sqlite3.Error as e:
-            logger.error(f"Error checking stream existence: {e}")
-            return False
-    
     def parse_date(self, date_string: str) -> Optional[str]:
         """Parse date string and return in YYYY-MM-DD format"""
         if not date_string:
             return None
         
-        try:
-            # Handle common date formats
-            if isinstance(date_string, str):
-                # Remove extra whitespace
-                date_string = date_string.strip()
-                
-                # Try different date formats
-                from datetime import datetime as dt
-                
-                # Common formats in VOD data
-                formats = [
-                    '%Y-%m-%d',           # 2023-01-15
-                    '%Y',                 # 2023
-                    '%d-%m-%Y',           # 15-01-2023
-                    '%m/%d/%Y',           # 01/15/2023
-                    '%Y-%m-%d %H:%M:%S'   # 2023-01-15 12:00:00
-                ]
-                
-                for fmt in formats:
-                    try:
-                        parsed = dt.strptime(date_string, fmt)
-                        return parsed.strftime('%Y-%m-%d')
-                    except ValueError:
-                        continue
-                
-                # If all formats fail, return original string
-                return date_string[:10] if len(date_string) >= 10 else date_string
-            
+        if not isinstance(date_string, str):
             return str(date_string)
-            
-        except Exception:
-            return None
+        
+        # Remove extra whitespace
+        date_string = date_string.strip()
+        
+        # One regex match instead of trying each strptime format in turn
+        match = _DATE_RE.fullmatch(date_string)
+        if match:
+            g = match.groups()
+            if g[0]:
+                year, month, day = int(g[0]), int(g[1]), int(g[2])
+            elif g[3]:
+                year, month, day = int(g[3]), 1, 1
+            elif g[4]:
+                year, month, day = int(g[6]), int(g[5]), int(g[4])
+            else:
+                year, month, day = int(g[9]), int(g[7]), int(g[8])
+            if year >= 1 and 1 <= month <= 12 and 1 <= day <= monthrange(year, month)[1]:
+                return f"{year:04d}-{month:02d}-{day:02d}"
+        
+        # If no format matches, return original string
+        return date_string[:10] if len(date_string) >= 10 else date_string
     
     def parse_duration(self, duration_str: str) -> Tuple[Optional[int], Optional[str]]:
         """Parse duration string and return seconds and formatted duration"""
         if not duration_str:
             return None, None
         
+        duration_str = str(duration_str).strip()
+        
+        # If it's already in seconds
+        if duration_str.isdigit():
+            seconds = int(duration_str)
+            hours = seconds // 3600
+            minutes = (seconds % 3600) // 60
+            secs = seconds % 60
+            formatted = f"{hours:02d}:{minutes:02d}:{secs:02d}"
+            return seconds, formatted
+        
+        # If it's in HH:MM:SS or MM:SS format
+        match = _HMS_RE.fullmatch(duration_str)
+        if match:
+            hours, minutes, seconds = match.groups()
+            total_seconds = (int(hours or 0) * 3600) + (int(minutes) * 60) + int(seconds)
+            return total_seconds, duration_str
+        
+        return None, duration_str
+    
+    
+    def build_stream_row(self, server_id: int, stream_data: Dict, category_mapping: Dict) -> Optional[Tuple]:
+        """Turn one API stream into an INSERT_STREAM_SQL parameter tuple, or None if it can't be stored"""
         try:
-            duration_str = str(duration_str).strip()
-            
-            # If it's already in seconds
-            if duration_str.isdigit():
-                seconds = int(duration_str)
-                hours = seconds // 3600
-                minutes = (seconds % 3600) // 60
-                secs = seconds % 60
-                formatted = f"{hours:02d}:{minutes:02d}:{secs:02d}"
-                return seconds, formatted
-            
-            # If it's in HH:MM:SS format
-            if ':' in duration_str:
-                parts = duration_str.split(':')
-                if len(parts) >= 2:
-                    try:
-                        hours = int(parts[0]) if len(parts) > 2 else 0
-                        minutes = int(parts[-2])
-                        seconds = int(parts[-1])
-                        total_seconds = (hours * 3600) + (minutes * 60) + seconds
-                        return total_seconds, duration_str
-                    except ValueError:
-                        pass
-            
-            return None, duration_str
-            
-        except Exception:
-            return None, str(duration_str)
-    
-    
-    def insert_stream(self, server_id: int, stream_data: Dict, category_mapping: Dict[int, int]) -> bool:
-        """Insert VOD stream into database"""
-        try:
-            cursor = self.conn.cursor()
-            
             # Extract stream information
             stream_id = stream_data.get('stream_id')
             if stream_id is None:
                 logger.warning(f"Stream missing stream_id: {stream_data.get('name', 'Unknown')}")
-                return False
+                return None
             
             name = stream_data.get('name', 'Unknown')
             stream_icon = stream_data.get('stream_icon', '')
@@ -454,41 +509,73 @@ class XtreamVODStreamsDownloader:
             
             # --- FIXED CATEGORY MAPPING ---
             category_id_api = stream_data.get('category_id')
-            db_category_id = None
-            if category_id_api is not None:
-                try:
-                    db_category_id = category_mapping.get(int(category_id_api))
-                except Exception:
-                    db_category_id = None
+            db_category_id = category_mapping.get(category_id_api)
             
             if db_category_id is None:
                 logger.warning(f"No matching category in database for API category_id {category_id_api}. Using default ID 0.")
                 db_category_id = 0  # Optional: use a default "Uncategorized" category ID
 
-            # Insert into database
-            cursor.execute("""
-                INSERT INTO vod_streams (
-                    server_id, category_id, stream_id, name, stream_icon, rating, rating_5based,
-                    added, container_extension, custom_sid, direct_source, plot, cast, director,
-                    genre, release_date, duration_secs, duration, video_quality
-                )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
+            return (
                 server_id, db_category_id, stream_id, name, stream_icon, rating, rating_5based,
                 added, container_extension, custom_sid, direct_source, plot, cast, director,
                 genre, release_date, duration_secs, duration, video_quality
-            ))
-            
-            return True
+            )
         
-        except sqlite3.Error as e:
-            logger.error(f"Error inserting VOD stream {stream_data.get('name', 'Unknown')}: {e}")
-            return False
         except Exception as e:
-            logger.error(f"Unexpected error inserting VOD stream {stream_data.get('name', 'Unknown')}: {e}")
-            return False
+            logger.error(f"Unexpected error preparing VOD stream {stream_data.get('name', 'Unknown')}: {e}")
+            return None
+    
+    def insert_streams(self, rows: List[Tuple]) -> int:
+        """Insert a batch of vod_streams rows in one statement, skipping ones already stored; returns the number added"""
+        cursor = self.conn.cursor()
+        cursor.executemany(INSERT_STREAM_SQL, rows)
+        return cursor.rowcount
     
-    def process_streams_for_server(self, server: Dict) -> Tuple[int, int, int]:
+    def fetch_server_streams(self, server: Dict) -> Tuple[List[Dict], bool, Optional[str]]:
+        """Download a server's VOD streams; returns (streams, was_cached, content_hash)"""
+        # Check if we have cached data; a stat is enough, download_vod_streams does the actual load
+        cache_key = self._generate_cache_key(server, "all")
+        has_cached = self._is_cache_valid(self._get_cache_file_path(cache_key))
+        
+        # No separate connection test: an unreachable server makes the download itself
+        # fail and return no streams. test_server_connection remains for diagnostics.
+        streams = self.download_vod_streams(server)
+        
+        # The cache file holds the response body as received, so hashing it fingerprints the catalogue
+        content_hash = None
+        if streams:
+            try:
+                content_hash = hashlib.sha256(self._get_cache_file_path(cache_key).read_bytes()).hexdigest()
+            except OSError as e:
+                logger.debug(f"Could not hash VOD cache for {server['name']}: {e}")
+        return streams, has_cached, content_hash
+    
+    def get_sync_hash(self, server_id: int) -> Optional[str]:
+        """Get the catalogue hash recorded by the last successful import for a server"""
+        row = self.conn.execute(
+            "SELECT content_hash FROM sync_state WHERE server_id = ? AND content_type = 'vod'", (server_id,)
+        ).fetchone()
+        return row[0] if row else None
+    
+    def set_sync_hash(self, server_id: int, content_hash: str):
+        """Record the catalogue hash of a completed import"""
+        with self.conn:
+            self.conn.execute("""
+                INSERT OR REPLACE INTO sync_state (server_id, content_type, content_hash, synced_at)
+                VALUES (?, 'vod', ?, CURRENT_TIMESTAMP)
+            """, (server_id, content_hash))
+    
+    def count_server_streams(self, server_id: int) -> int:
+        """Number of VOD streams currently stored for a server"""
+        return self.conn.execute("SELECT COUNT(*) FROM vod_streams WHERE server_id = ?", (server_id,)).fetchone()[0]
+    
+    @staticmethod
+    def count_distinct_streams(streams: List[Dict]) -> int:
+        """Number of rows a full import of this catalogue stores: one per distinct stream_id"""
+        return len({str(stream['stream_id']) for stream in streams
+                    if isinstance(stream, dict) and stream.get('stream_id') is not None})
+    
+    def process_streams_for_server(self, server: Dict, streams: List[Dict], content_hash: Optional[str] = None) -> Tuple[int, int, int]:
         """Process all VOD streams for a single server"""
         total_downloaded = 0
         total_new = 0
@@ -499,65 +586,55 @@ class XtreamVODStreamsDownloader:
             
             # Get category mapping for this server
             category_mapping = self.get_category_mapping(server['id'])
-            logger.info(f"Found {len(category_mapping)} VOD categories for server {server['name']}")
             
-            # Download all VOD streams
-            streams = self.download_vod_streams(server)
             if not streams:
                 logger.warning(f"No VOD streams found for server: {server['name']}")
                 return 0, 0, 0
             
+            # Nothing to insert if the catalogue is byte-for-byte what the last run imported and
+            # every stream from it is still stored; rows removed since then need the full pass
+            if (content_hash and content_hash == self.get_sync_hash(server['id'])
+                    and self.count_server_streams(server['id']) == self.count_distinct_streams(streams)):
+                logger.info(f"VOD catalogue for {server['name']} unchanged since last run, skipping insert")
+                return len(streams), 0, len(streams)
+            
             downloaded_count = len(streams)
             new_count = 0
-            existing_count = 0
+            queued = 0
             
-            # Process streams in batches for better performance
-            batch_size = 1000
-            total_batches = (len(streams) + batch_size - 1) // batch_size
-            
-            for batch_num in range(total_batches):
-                start_idx = batch_num * batch_size
-                end_idx = min((batch_num + 1) * batch_size, len(streams))
-                batch_streams = streams[start_idx:end_idx]
-                
-                logger.info(f"Processing batch {batch_num + 1}/{total_batches} ({len(batch_streams)} streams)")
-                
-                batch_new = 0
-                batch_existing = 0
-                
-                # Process each stream in the batch
-                for stream_data in batch_streams:
+            # Rows are built lazily and consumed in fixed-size batches, so neither slices of
+            # the stream list nor a full list of parameter tuples are held alongside it
+            def stream_rows():
+                nonlocal queued
+                for stream_data in streams:
                     if not isinstance(stream_data, dict):
                         logger.warning(f"Invalid stream data format: {stream_data}")
                         continue
                     
-                    stream_id = stream_data.get('stream_id')
-                    if stream_id is None:
-                        logger.warning(f"Stream missing stream_id: {stream_data}")
-                        continue
-                    
-                    # Check if stream already exists
-                    if self.stream_exists(server['id'], stream_id):
-                        batch_existing += 1
-                        logger.debug(f"Stream already exists: {stream_data.get('name', 'Unknown')}")
-                        continue
-                    
-                    # Insert new stream
-                    if self.insert_stream(server['id'], stream_data, category_mapping):
-                        batch_new += 1
-                        logger.debug(f"Inserted new stream: {stream_data.get('name', 'Unknown')}")
-                
-                # Commit after each batch
-                self.conn.commit()
+                    row = self.build_stream_row(server['id'], stream_data, category_mapping)
+                    if row is not None:
+                        queued += 1
+                        yield row
+            
+            rows = stream_rows()
+            batch_num = 0
+            while True:
+                batch = list(islice(rows, self.BATCH_SIZE))
+                if not batch:
+                    break
+                batch_num += 1
                 
+                # Insert the whole batch in one transaction; existing streams are ignored
+                with self.conn:
+                    batch_new = self.insert_streams(batch)
                 new_count += batch_new
-                existing_count += batch_existing
                 
-                logger.info(f"Batch {batch_num + 1} completed: {batch_new} new, {batch_existing} existing")
-                
-                # Short pause between batches
-                if batch_num < total_batches - 1:
-                    time.sleep(0.1)
+                logger.info(f"Batch {batch_num} completed: {batch_new} new, {len(batch) - batch_new} existing")
+            
+            existing_count = queued - new_count
+            
+            if content_hash:
+                self.set_sync_hash(server['id'], content_hash)
             
             logger.info(f"Server {server['name']} - VOD streams: {downloaded_count} downloaded, {new_count} new, {existing_count} existing")
             
@@ -600,42 +677,35 @@ class XtreamVODStreamsDownloader:
             if cache_stats:
                 logger.info(f"Cache status: {cache_stats['valid_files']} valid files, {cache_stats['expired_files']} expired, {cache_stats['total_size_mb']} MB")
             
-            for i, server in enumerate(servers, 1):
-                logger.info(f"Processing server {i}/{total_servers}: {server['name']}")
-                
-                # Check if we have cached data
-                cache_key = self._generate_cache_key(server, "all")
-                has_cached = self._load_from_cache(cache_key) is not None
-                
-                # Test server connection if no cache available
-                if not has_cached and not self.test_server_connection(server):
-                    logger.error(f"Skipping server {server['name']} due to connection issues")
-                    continue
-                
-                # Process streams for this server
-                downloaded, new, existing = self.process_streams_for_server(server)
+            # Download all servers concurrently; each server is written as soon as its own
+            # download finishes while the rest keep running. SQLite stays on this thread.
+            with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+                futures = [executor.submit(self.fetch_server_streams, server) for server in servers]
                 
-                # Count cache hits vs API calls
-                if has_cached:
-                    cache_hits += 1
-                else:
-                    api_calls += 1
-                
-                if downloaded > 0:
-                    successful_servers += 1
-                    grand_total_downloaded += downloaded
-                    grand_total_new += new
-                    grand_total_existing += existing
+                for i, (server, future) in enumerate(zip(servers, futures), 1):
+                    logger.info(f"Processing server {i}/{total_servers}: {server['name']}")
                     
-                    cache_info = "(cached)" if has_cached else "(API call)"
-                    logger.info(f"Server {server['name']} completed: {downloaded} total, {new} new, {existing} existing {cache_info}")
-                else:
-                    logger.warning(f"No VOD streams downloaded from server: {server['name']}")
-                
-                # Longer delay between servers for VOD (larger datasets)
-                if i < total_servers:
-                    delay = 1 if has_cached else 5  # Longer delay for API calls due to large responses
-                    time.sleep(delay)
+                    streams, has_cached, content_hash = future.result()
+                    
+                    # Process streams for this server
+                    downloaded, new, existing = self.process_streams_for_server(server, streams, content_hash)
+                    
+                    # Count cache hits vs API calls
+                    if has_cached:
+                        cache_hits += 1
+                    else:
+                        api_calls += 1
+                    
+                    if downloaded > 0:
+                        successful_servers += 1
+                        grand_total_downloaded += downloaded
+                        grand_total_new += new
+                        grand_total_existing += existing
+                        
+                        cache_info = "(cached)" if has_cached else "(API call)"
+                        logger.info(f"Server {server['name']} completed: {downloaded} total, {new} new, {existing} existing {cache_info}")
+                    else:
+                        logger.warning(f"No VOD streams downloaded from server: {server['name']}")
             
             # Final summary with cache statistics
             logger.info("="*70)
@@ -669,9 +739,16 @@ class XtreamVODStreamsDownloader:
             
             stats = {}
             
-            # Total VOD streams
-            cursor.execute("SELECT COUNT(*) as total FROM vod_streams")
-            stats['total_streams'] = cursor.fetchone()['total']
+            # Totals, rating and release date coverage in a single table scan
+            cursor.execute("""
+                SELECT COUNT(*) as total,
+                       SUM(CASE WHEN rating > 0 THEN 1 ELSE 0 END) as with_rating,
+                       SUM(CASE WHEN release_date IS NOT NULL THEN 1 ELSE 0 END) as with_date,
+                       AVG(CASE WHEN rating > 0 THEN rating END) as avg_rating
+                FROM vod_streams
+            """)
+            totals = cursor.fetchone()
+            stats['total_streams'] = totals['total']
             
             # Streams by server
             cursor.execute("""
@@ -699,17 +776,9 @@ class XtreamVODStreamsDownloader:
                 genre_stats[row['genre']] = row['count']
             stats['top_genres'] = genre_stats
             
-            # Streams with ratings
-            cursor.execute("SELECT COUNT(*) as count FROM vod_streams WHERE rating > 0")
-            stats['streams_with_ratings'] = cursor.fetchone()['count']
-            
-            # Streams with release dates
-            cursor.execute("SELECT COUNT(*) as count FROM vod_streams WHERE release_date IS NOT NULL")
-            stats['streams_with_release_date'] = cursor.fetchone()['count']
-            
-            # Average rating
-            cursor.execute("SELECT AVG(rating) as avg_rating FROM vod_streams WHERE rating > 0")
-            avg_rating = cursor.fetchone()['avg_rating']
+            stats['streams_with_ratings'] = totals['with_rating'] or 0
+            stats['streams_with_release_date'] = totals['with_date'] or 0
+            avg_rating = totals['avg_rating']
             stats['average_rating'] = round(avg_rating, 2) if avg_rating else 0
             
             return stats
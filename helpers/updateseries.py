@@ -2,14 +2,19 @@ import sqlite3
 import requests
 import json
 import logging
-import time
 import hashlib
 import pickle
+import gzip
 import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
 from urllib.parse import urljoin
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from functools import lru_cache
 
 # Disable SSL warnings for IPTV servers with invalid certificates
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -18,7 +23,57 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Server downloads are pure network I/O, so fetch them concurrently
+DOWNLOAD_WORKERS = 8
+
+# Prepared once and reused by executemany for every batch. The unique (server_id, series_id)
+# index turns a repeat into an in-place update, so no existence check is needed, and the
+# Xtream category id is resolved to the local categories.id through that table's unique index.
+UPSERT_SERIES_SQL = """
+    INSERT INTO series (
+        server_id, series_id, name, cover, plot, cast, director, genre, rating, release_date, last_modified, category_id
+    ) VALUES (
+        ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+        (SELECT id FROM categories WHERE server_id = ? AND category_id = ? AND content_type = 'series')
+    )
+    ON CONFLICT(server_id, series_id) DO UPDATE SET
+        name = excluded.name, cover = excluded.cover, plot = excluded.plot, cast = excluded.cast,
+        director = excluded.director, genre = excluded.genre, rating = excluded.rating,
+        release_date = excluded.release_date, last_modified = excluded.last_modified,
+        category_id = excluded.category_id
+"""
+
+def _series_row(server_id: int, s: Dict) -> Tuple:
+    """Build the UPSERT_SERIES_SQL parameter tuple for one API series"""
+    rating = s.get('rating')
+    return (
+        server_id, s.get('series_id'), s.get('name', 'Unknown'), s.get('cover', ''), s.get('plot', ''),
+        s.get('cast', ''), s.get('director', ''), s.get('genre', ''), float(rating) if rating else 0.0,
+        s.get('releaseDate', ''), s.get('last_modified', ''), server_id, s.get('category_id') or None
+    )
+
+@lru_cache(maxsize=256)
+def _cache_key_for(url: str, username: str) -> str:
+    """Hash server details into a series cache key (memoized)"""
+    key_data = f"{url}_{username}_series".encode()
+    return hashlib.blake2b(key_data, digest_size=16).hexdigest()
+
+@lru_cache(maxsize=256)
+def _series_url_for(url: str, port, username: str, password: str) -> str:
+    """Build the get_series API URL for a server (memoized)"""
+    base_url = url
+    if not base_url.startswith(('http://', 'https://')):
+        base_url = f"http://{base_url}"
+    if port and port != 80:
+        if ':' not in base_url.split('://', 1)[1]:
+            base_url = f"{base_url}:{port}"
+    api_url = urljoin(base_url, '/player_api.php')
+    return f"{api_url}?username={username}&password={password}&action=get_series"
+
 class XtreamSeriesDownloader:
+    # Rows written per transaction
+    BATCH_SIZE = 1000
+
     def __init__(self, db_path: str = None, cache_hours: int = 24):
         if db_path is None:
             script_dir = Path(__file__).parent
@@ -27,11 +82,18 @@ class XtreamSeriesDownloader:
         self.db_path = Path(db_path)
         self.cache_hours = cache_hours
         self.conn = None
+        self._cur = None
         self.session = requests.Session()
         self.session.timeout = 30
         self.session.verify = False
+        # Keep-alive pool sized for concurrent server fetches; transient gateway errors are retried with backoff
+        retry = Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504], allowed_methods=["GET"])
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=64, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
         self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+            'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+            'Accept-Encoding': 'gzip, deflate'
         })
         self.cache_dir = self.db_path.parent / "cache" / "series"
         self.cache_dir.mkdir(parents=True, exist_ok=True)
@@ -39,12 +101,32 @@ class XtreamSeriesDownloader:
         logger.info("SSL verification disabled for IPTV server compatibility")
 
     def _generate_cache_key(self, server: Dict) -> str:
-        key_data = f"{server['url']}_{server['username']}_series"
-        return hashlib.md5(key_data.encode()).hexdigest()
+        return _cache_key_for(server['url'], server['username'])
 
     def _get_cache_file_path(self, cache_key: str) -> Path:
+        return self.cache_dir / f"{cache_key}.json.gz"
+
+    def _get_legacy_cache_file_path(self, cache_key: str) -> Path:
         return self.cache_dir / f"{cache_key}.pkl"
 
+    def _get_validators_file_path(self, cache_key: str) -> Path:
+        return self.cache_dir / f"{cache_key}.meta.json"
+
+    def _conditional_headers(self, cache_key: str) -> Dict[str, str]:
+        """If-None-Match / If-Modified-Since headers for revalidating an expired cache file, if any"""
+        try:
+            if not self._get_cache_file_path(cache_key).exists():
+                return {}
+            validators = json.loads(self._get_validators_file_path(cache_key).read_bytes())
+        except (OSError, ValueError):
+            return {}
+        headers = {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+        return headers
+
     def _is_cache_valid(self, cache_file: Path) -> bool:
         if not cache_file.exists():
             return False
@@ -52,16 +134,24 @@ class XtreamSeriesDownloader:
         expiry_time = datetime.now() - timedelta(hours=self.cache_hours)
         return file_modified > expiry_time
 
-    def _save_to_cache(self, cache_key: str, data: List[Dict]) -> bool:
+    def _save_to_cache(self, cache_key: str, payload: bytes, response_headers: Optional[Dict] = None) -> bool:
+        """Store the raw JSON response body gzip-compressed; the file's mtime is the cache timestamp"""
         try:
             cache_file = self._get_cache_file_path(cache_key)
-            cache_data = {
-                'timestamp': datetime.now(),
-                'data': data
+            cache_file.write_bytes(gzip.compress(payload, compresslevel=3))
+            # Keep the server's validators so an expired copy can be revalidated instead of re-downloaded
+            validators = {
+                'etag': (response_headers or {}).get('ETag'),
+                'last_modified': (response_headers or {}).get('Last-Modified'),
             }
-            with open(cache_file, 'wb') as f:
-                pickle.dump(cache_data, f)
-            logger.debug(f"Saved {len(data)} items to cache: {cache_file.name}")
+            validators_file = self._get_validators_file_path(cache_key)
+            if any(validators.values()):
+                validators_file.write_text(json.dumps(validators))
+            else:
+                validators_file.unlink(missing_ok=True)
+            # The pickle written by older versions is superseded now
+            self._get_legacy_cache_file_path(cache_key).unlink(missing_ok=True)
+            logger.debug(f"Saved {len(payload)} bytes to cache: {cache_file.name}")
             return True
         except Exception as e:
             logger.error(f"Error saving to cache {cache_key}: {e}")
@@ -70,13 +160,22 @@ class XtreamSeriesDownloader:
     def _load_from_cache(self, cache_key: str) -> Optional[List[Dict]]:
         try:
             cache_file = self._get_cache_file_path(cache_key)
-            if not self._is_cache_valid(cache_file):
+            if self._is_cache_valid(cache_file):
+                data = json.loads(gzip.decompress(cache_file.read_bytes()))
+                if not isinstance(data, list):
+                    return None
+                logger.info(f"Loaded {len(data)} items from cache: {cache_file.name}")
+                return data
+
+            # Still honour a fresh pickle cache from an older version until it expires
+            legacy_file = self._get_legacy_cache_file_path(cache_key)
+            if not self._is_cache_valid(legacy_file):
                 return None
-            with open(cache_file, 'rb') as f:
+            with open(legacy_file, 'rb') as f:
                 cache_data = pickle.load(f)
             data = cache_data.get('data', [])
             timestamp = cache_data.get('timestamp')
-            logger.info(f"Loaded {len(data)} items from cache: {cache_file.name} (cached: {timestamp})")
+            logger.info(f"Loaded {len(data)} items from legacy cache: {legacy_file.name} (cached: {timestamp})")
             return data
         except Exception as e:
             logger.warning(f"Error loading from cache {cache_key}: {e}")
@@ -89,20 +188,50 @@ class XtreamSeriesDownloader:
                 return False
             self.conn = sqlite3.connect(self.db_path)
             self.conn.row_factory = sqlite3.Row
+            # WAL + NORMAL sync avoids an fsync per batch commit; keep temp data and hot pages in memory
+            self.conn.executescript("""
+                PRAGMA journal_mode=WAL;
+                PRAGMA synchronous=NORMAL;
+                PRAGMA temp_store=MEMORY;
+                PRAGMA mmap_size=268435456;
+                PRAGMA cache_size=-65536;
+            """)
+            # One cursor reused by every query so SQLite's statement cache stays warm
+            self._cur = self.conn.cursor()
+            self.ensure_unique_series_index()
             logger.info(f"Connected to database: {self.db_path}")
             return True
         except sqlite3.Error as e:
             logger.error(f"Database connection error: {e}")
             return False
 
+    def ensure_unique_series_index(self):
+        """Create the unique (server_id, series_id) index on databases that predate it"""
+        try:
+            with self.conn:
+                self._cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_series_server_sid ON series(server_id, series_id)")
+        except sqlite3.IntegrityError:
+            # Older imports could store the same series twice; keep the first copy of each
+            logger.info("Removing duplicate series before creating unique index")
+            with self.conn:
+                self._cur.execute("""
+                    DELETE FROM series WHERE id NOT IN (
+                        SELECT MIN(id) FROM series GROUP BY server_id, series_id
+                    )
+                """)
+                self._cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_series_server_sid ON series(server_id, series_id)")
+
     def close_db(self):
+        if self._cur:
+            self._cur.close()
+            self._cur = None
         if self.conn:
             self.conn.close()
             logger.info("Database connection closed")
 
     def get_servers(self) -> List[Dict]:
         try:
-            cursor = self.conn.cursor()
+            cursor = self._cur
             cursor.execute("""
                 SELECT id, name, url, username, password, port 
                 FROM servers 
@@ -114,16 +243,7 @@ class XtreamSeriesDownloader:
             return []
 
     def build_api_url(self, server: Dict) -> str:
-        base_url = server['url']
-        if not base_url.startswith(('http://', 'https://')):
-            base_url = f"http://{base_url}"
-        port = server.get('port', 80)
-        if port and port != 80:
-            if ':' not in base_url.split('://', 1)[1]:
-                base_url = f"{base_url}:{port}"
-        api_url = urljoin(base_url, '/player_api.php')
-        params = f"username={server['username']}&password={server['password']}&action=get_series"
-        return f"{api_url}?{params}"
+        return _series_url_for(server['url'], server.get('port', 80), server['username'], server['password'])
 
     def test_server_connection(self, server: Dict) -> bool:
         try:
@@ -143,160 +263,92 @@ class XtreamSeriesDownloader:
             logger.error(f"Error testing server {server['name']}: {e}")
             return False
 
-    def get_category_mapping(self, server_id: int) -> Dict[int, int]:
-        """
-        Returns a mapping of Xtream category_id -> local category_id in the database
-        """
-        mapping = {}
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT id, category_id FROM categories WHERE server_id = ? AND content_type = 'series'", (server_id,))
-            rows = cursor.fetchall()
-            mapping = {row['category_id']: row['id'] for row in rows if row['category_id'] is not None}
-        except sqlite3.Error as e:
-            logger.error(f"Error fetching category mapping for server {server_id}: {e}")
-        return mapping
-
-    def series_exists(self, server_id: int, series_id: int) -> bool:
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT 1 FROM series WHERE server_id = ? AND series_id = ?", (server_id, series_id))
-            return cursor.fetchone() is not None
-        except sqlite3.Error as e:
-            logger.error(f"Error checking series existence: {e}")
-            return False
-
-    def insert_series(self, server_id: int, series_data: Dict, category_mapping: Dict[int, int]) -> bool:
-        try:
-            cursor = self.conn.cursor()
-            series_id = series_data.get('series_id')
-            name = series_data.get('name', 'Unknown')
-            cover = series_data.get('cover', '')
-            plot = series_data.get('plot', '')
-            cast = series_data.get('cast', '')
-            director = series_data.get('director', '')
-            genre = series_data.get('genre', '')
-            rating = float(series_data.get('rating', 0.0)) if series_data.get('rating') else 0.0
-            release_date = series_data.get('releaseDate', '')
-            last_modified = series_data.get('last_modified', '')
-            xtream_category_id_str = series_data.get('category_id')
-            xtream_category_id = int(xtream_category_id_str) if xtream_category_id_str else None
-            category_id = category_mapping.get(xtream_category_id) if xtream_category_id is not None else None
-
-            cursor.execute("""
-                INSERT INTO series (
-                    server_id, series_id, name, cover, plot, cast, director, genre, rating, release_date, last_modified, category_id
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                server_id, series_id, name, cover, plot, cast, director, genre, rating, release_date, last_modified, category_id
-            ))
-            return True
-        except sqlite3.Error as e:
-            logger.error(f"Error inserting series {series_data.get('name', 'Unknown')}: {e}")
-            return False
-
-    def update_series(self, server_id: int, series_data: Dict, category_mapping: Dict[int, int]) -> bool:
+    def fetch_series_for_server(self, server: Dict) -> Optional[List[Dict]]:
+        """Load a server's series list from cache or the API; network only, safe to run in a worker thread"""
+        cache_key = self._generate_cache_key(server)
+        series_list = self._load_from_cache(cache_key)
+        if series_list is not None:
+            logger.info(f"Using cached series for {server['name']} ({len(series_list)} items)")
+            return series_list
+
+        # test_server_connection issues this same get_series request, so the download itself
+        # doubles as the reachability check; connection and JSON errors land in the except below
+        url = self.build_api_url(server)
+        logger.info(f"Fetching series from {server['name']} (cache miss)")
         try:
-            cursor = self.conn.cursor()
-            series_id = series_data.get('series_id')
-            name = series_data.get('name', 'Unknown')
-            cover = series_data.get('cover', '')
-            plot = series_data.get('plot', '')
-            cast = series_data.get('cast', '')
-            director = series_data.get('director', '')
-            genre = series_data.get('genre', '')
-            rating = float(series_data.get('rating', 0.0)) if series_data.get('rating') else 0.0
-            release_date = series_data.get('releaseDate', '')
-            last_modified = series_data.get('last_modified', '')
-            xtream_category_id_str = series_data.get('category_id')
-            xtream_category_id = int(xtream_category_id_str) if xtream_category_id_str else None
-            category_id = category_mapping.get(xtream_category_id) if xtream_category_id is not None else None
-
-            cursor.execute("""
-                UPDATE series SET
-                    name = ?, cover = ?, plot = ?, cast = ?, director = ?, genre = ?,
-                    rating = ?, release_date = ?, last_modified = ?, category_id = ?
-                WHERE server_id = ? AND series_id = ?
-            """, (
-                name, cover, plot, cast, director, genre, rating, release_date, last_modified, category_id,
-                server_id, series_id
-            ))
-            return True
-        except sqlite3.Error as e:
-            logger.error(f"Error updating series {series_data.get('name', 'Unknown')}: {e}")
-            return False
+            headers = self._conditional_headers(cache_key)
+            response = self.session.get(url, timeout=90, verify=False, headers=headers)
+            if response.status_code == 304:
+                # Unchanged on the server: refresh the expired copy's timestamp and reuse it
+                self._get_cache_file_path(cache_key).touch()
+                series_list = self._load_from_cache(cache_key)
+                if series_list is not None:
+                    logger.info(f"Series for {server['name']} not modified, reusing cache ({len(series_list)} items)")
+                    return series_list
+                response = self.session.get(url, timeout=90, verify=False)
+            response.raise_for_status()
+            series_list = json.loads(response.content)
+            if isinstance(series_list, list):
+                logger.info(f"Downloaded {len(series_list)} series from {server['name']}")
+                # Cache the body as received; nothing is re-serialized
+                self._save_to_cache(cache_key, response.content, response.headers)
+                return series_list
+            logger.warning(f"Unexpected response format for series from {server['name']}")
+            return None
+        except Exception as e:
+            logger.error(f"Error downloading series from {server['name']}: {e}")
+            return None
 
-    def process_series_for_server(self, server: Dict) -> Tuple[int, int, int]:
+    def process_series_for_server(self, server: Dict, series_list: Optional[List[Dict]]) -> Tuple[int, int, int]:
         total_downloaded = 0
         total_new = 0
         total_existing = 0
         try:
             logger.info(f"Processing series for server: {server['name']}")
-            cache_key = self._generate_cache_key(server)
-            series_list = self._load_from_cache(cache_key)
-            category_mapping = self.get_category_mapping(server['id'])
-
-            if series_list is not None:
-                logger.info(f"Using cached series for {server['name']} ({len(series_list)} items)")
-            else:
-                if not self.test_server_connection(server):
-                    logger.error(f"Skipping server {server['name']} due to connection issues")
-                    return 0, 0, 0
-                url = self.build_api_url(server)
-                logger.info(f"Fetching series from {server['name']} (cache miss)")
-                try:
-                    response = self.session.get(url, timeout=90, verify=False)
-                    response.raise_for_status()
-                    series_list = response.json()
-                    if isinstance(series_list, list):
-                        logger.info(f"Downloaded {len(series_list)} series from {server['name']}")
-                        self._save_to_cache(cache_key, series_list)
-                    else:
-                        logger.warning(f"Unexpected response format for series from {server['name']}")
-                        return 0, 0, 0
-                except Exception as e:
-                    logger.error(f"Error downloading series from {server['name']}: {e}")
-                    return 0, 0, 0
 
             if not series_list:
                 logger.warning(f"No series found for server: {server['name']}")
                 return 0, 0, 0
 
+            # The upsert doesn't report inserts and updates separately, so new series are
+            # counted from the server's row count, which the unique index answers directly
+            cursor = self._cur
+            count_sql = "SELECT COUNT(*) FROM series WHERE server_id = ?"
+
             downloaded_count = len(series_list)
             new_count = 0
             existing_count = 0
-            batch_size = 1000
-            total_batches = (downloaded_count + batch_size - 1) // batch_size
-
-            for batch_num in range(total_batches):
-                start_idx = batch_num * batch_size
-                end_idx = min((batch_num + 1) * batch_size, downloaded_count)
-                batch_series = series_list[start_idx:end_idx]
-                logger.info(f"Processing batch {batch_num + 1}/{total_batches} ({len(batch_series)} series)")
-                batch_new = 0
-                batch_existing = 0
-
-                for series_data in batch_series:
+
+            # Rows are built lazily and consumed in fixed-size batches, so neither slices of
+            # the series list nor a full list of parameter tuples are held alongside it
+            def valid_series():
+                for series_data in series_list:
                     if not isinstance(series_data, dict):
                         logger.warning(f"Invalid series data format: {series_data}")
-                        continue
-                    series_id = series_data.get('series_id')
-                    if series_id is None:
+                    elif series_data.get('series_id') is None:
                         logger.warning(f"Series missing series_id: {series_data}")
-                        continue
-                    if self.series_exists(server['id'], series_id):
-                        if self.update_series(server['id'], series_data, category_mapping):
-                            batch_existing += 1 # Count as existing and updated
                     else:
-                        if self.insert_series(server['id'], series_data, category_mapping):
-                            batch_new += 1
-
-                self.conn.commit()
+                        yield series_data
+
+            server_id = server['id']
+            rows = (_series_row(server_id, s) for s in valid_series())
+            batch_num = 0
+            while True:
+                batch = list(islice(rows, self.BATCH_SIZE))
+                if not batch:
+                    break
+                batch_num += 1
+
+                # Write the whole batch in one transaction
+                with self.conn:
+                    before = cursor.execute(count_sql, (server['id'],)).fetchone()[0]
+                    cursor.executemany(UPSERT_SERIES_SQL, batch)
+                    after = cursor.execute(count_sql, (server['id'],)).fetchone()[0]
+                batch_new = after - before
+                batch_existing = len(batch) - batch_new  # Count as existing and updated
                 new_count += batch_new
                 existing_count += batch_existing
-                logger.info(f"Batch {batch_num + 1} completed: {batch_new} new, {batch_existing} existing")
-                if batch_num < total_batches - 1:
-                    time.sleep(0.1)
+                logger.info(f"Batch {batch_num} completed: {batch_new} new, {batch_existing} existing")
 
             logger.info(f"Server {server['name']} - series: {downloaded_count} downloaded, {new_count} new, {existing_count} updated")
             total_downloaded = downloaded_count
@@ -324,18 +376,21 @@ class XtreamSeriesDownloader:
             grand_total_existing = 0
             logger.info(f"Starting series download for {total_servers} servers")
 
-            for i, server in enumerate(servers, 1):
-                logger.info(f"Processing server {i}/{total_servers}: {server['name']}")
-                downloaded, new, existing = self.process_series_for_server(server)
-                if downloaded > 0:
-                    successful_servers += 1
-                    grand_total_downloaded += downloaded
-                    grand_total_new += new
-                    grand_total_existing += existing
-                else:
-                    logger.warning(f"No series downloaded from server: {server['name']}")
-                if i < total_servers:
-                    time.sleep(1)
+            # Download all servers concurrently; each server is written as soon as its own
+            # download finishes while the rest keep running. SQLite stays on this thread.
+            with ThreadPoolExecutor(max_workers=min(DOWNLOAD_WORKERS, total_servers)) as executor:
+                futures = [executor.submit(self.fetch_series_for_server, server) for server in servers]
+
+                for i, (server, future) in enumerate(zip(servers, futures), 1):
+                    logger.info(f"Processing server {i}/{total_servers}: {server['name']}")
+                    downloaded, new, existing = self.process_series_for_server(server, future.result())
+                    if downloaded > 0:
+                        successful_servers += 1
+                        grand_total_downloaded += downloaded
+                        grand_total_new += new
+                        grand_total_existing += existing
+                    else:
+                        logger.warning(f"No series downloaded from server: {server['name']}")
 
             logger.info("="*70)
             logger.info("SERIES DOWNLOAD SUMMARY")
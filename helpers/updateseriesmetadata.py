@@ -1,11 +1,18 @@
 import sqlite3
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import logging
 import time
-import pickle
+import json
+import zlib
+import atexit
+import threading
+import queue
+from collections import namedtuple
+from operator import add
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 # Configure logging
 import sys
@@ -14,16 +21,24 @@ logger = logging.getLogger(__name__)
 
 # Paths
 DB_PATH = Path(__file__).parent.parent / "database" / "media_player.db"
-CACHE_DIR = DB_PATH.parent / "cache" / "series_metadata"
-CACHE_DIR.mkdir(parents=True, exist_ok=True)
+# All cached API responses live in one SQLite file rather than one pickle per series
+CACHE_DB = DB_PATH.parent / "cache" / "series_metadata.db"
+CACHE_DB.parent.mkdir(parents=True, exist_ok=True)
 CACHE_EXPIRY = 24 * 60 * 60  # 24 hours in seconds
 
-# Rate limit (seconds between API requests)
+# Rate limit (average seconds between API requests to one server, shared by all workers)
 RATE_LIMIT_DELAY = 1.0
 
 # Thread pool size for fetching metadata
 THREAD_WORKERS = 4
 
+# Series submitted to the pool at any one time; keeps memory flat however large the library is
+MAX_IN_FLIGHT = THREAD_WORKERS * 2
+
+# The writer thread commits once this many episodes (or series) are queued, or after this many seconds
+EPISODE_BATCH_SIZE = 50
+WRITE_BATCH_SECONDS = 0.1
+
 
 
 # Columns to update in the series table
@@ -32,84 +47,302 @@ SERIES_UPDATE_COLUMNS = [
     "episode_run_time", "category_id", "category_ids"
 ]
 
-def fetch_series_metadata(server, series_id):
-    retries = 3
-    delay = 1  # initial delay in seconds
-    for i in range(retries):
-        try:
-            base_url = server['url'].strip()
-            if not base_url.startswith(('http://', 'https://')):
-                base_url = 'http://' + base_url
-            port = server.get('port', 80)
-            if port and port not in (80, 443) and ':' not in base_url.split('://', 1)[1]:
-                base_url = f"{base_url}:{port}"
-            base_url = base_url.rstrip('/')
-            url = f"{base_url}/player_api.php?username={server['username']}&password={server['password']}&action=get_series_info&series_id={series_id}"
-            
-            start_time = time.time()
-            logger.info(f"Fetching metadata for series_id {series_id} (Attempt {i+1}/{retries}). URL: {url}")
-            response = requests.get(url, timeout=30, verify=False)
-            end_time = time.time()
-            
-            response_size = len(response.content)
-            logger.info(f"Received response for series_id {series_id} (Attempt {i+1}/{retries}). Status: {response.status_code}, Time: {end_time - start_time:.2f}s, Size: {response_size} bytes")
-            response.raise_for_status()
-            
-            json_response = response.json()
-            if isinstance(json_response, list):
-                logger.warning(f"API response for series_id {series_id} is a list, expected a dictionary. Response: {json_response}")
-                return None
-            return json_response
-        except requests.exceptions.RequestException as e:
-            logger.warning(f"Network error fetching metadata for series_id {series_id} (attempt {i+1}/{retries}): {e}")
-            if i < retries - 1:
-                time.sleep(delay)
-                delay *= 2 # Exponential backoff
-            else:
-                return None
-        except ValueError as e: # Catches JSON decoding errors
-            logger.warning(f"JSON decoding error for series_id {series_id} (attempt {i+1}/{retries}): {e}. Response text: {response.text}")
-            return None
-        except Exception as e:
-            logger.warning(f"An unexpected error occurred fetching metadata for series_id {series_id} (attempt {i+1}/{retries}): {e}")
-            return None
-    return None
+# Built once at import so every update reuses the same statement text (and SQLite's cached statement)
+SERIES_UPDATE_SQL = f"UPDATE series SET {', '.join(f'{key}=?' for key in SERIES_UPDATE_COLUMNS)} WHERE series_id=?"
+
+# Per worker thread: a keep-alive HTTP session and database connections opened with their PRAGMAs applied once
+_thread_local = threading.local()
+_open_connections = set()
+_connections_lock = threading.Lock()
+
+def _get_conn(db_path):
+    """Return this thread's database connection, creating it on first use."""
+    conn = getattr(_thread_local, "conn", None)
+    if conn is None or conn not in _open_connections:
+        conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-20000")
+        with _connections_lock:
+            _open_connections.add(conn)
+        _thread_local.conn = conn
+    return conn
+
+def _get_cache_conn():
+    """Return this thread's connection to the metadata cache database."""
+    conn = getattr(_thread_local, "cache_conn", None)
+    if conn is None or conn not in _open_connections:
+        conn = sqlite3.connect(CACHE_DB, timeout=30, isolation_level=None, check_same_thread=False)
+        # Entries can always be re-fetched, so don't pay for durability
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("CREATE TABLE IF NOT EXISTS series_cache (series_id INTEGER PRIMARY KEY, fetched_at INTEGER, payload BLOB, etag TEXT, last_modified TEXT)")
+        # Cache files created before the HTTP validators were stored
+        for column in ("etag", "last_modified"):
+            try:
+                conn.execute(f"ALTER TABLE series_cache ADD COLUMN {column} TEXT")
+            except sqlite3.OperationalError:
+                pass
+        with _connections_lock:
+            _open_connections.add(conn)
+        _thread_local.cache_conn = conn
+    return conn
+
+def _close_connections():
+    """Close every pooled connection; threads reopen one on their next _get_conn call."""
+    with _connections_lock:
+        for conn in _open_connections:
+            conn.close()
+        _open_connections.clear()
+
+atexit.register(_close_connections)
+
+def _get_session():
+    """Return this thread's pooled requests session, creating it on first use."""
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        # Transient failures are retried inside urllib3 with exponential backoff
+        retry = Retry(total=3, backoff_factor=1, status_forcelist=[502, 503, 504], allowed_methods=["GET"])
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers["Connection"] = "keep-alive"
+        _thread_local.session = session
+    return session
+
+class TokenBucket:
+    """Thread-safe token bucket: acquire() blocks until a request may be sent."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+# One bucket per server, so workers share that server's request budget
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+def _rate_limiter_for(server):
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(server['id'])
+        if limiter is None:
+            limiter = _rate_limiters[server['id']] = TokenBucket(1 / RATE_LIMIT_DELAY, THREAD_WORKERS)
+        return limiter
+
+# Returned by fetch_series_metadata when the server answers 304 Not Modified
+NOT_MODIFIED = object()
+
+# What process_series did for one series; main() sums these field by field for the run summary
+SeriesResult = namedtuple("SeriesResult", "queued cache_hit revalidated fetched fetch_ms")
+
+def fetch_series_metadata(server, series_id, validators=(None, None)):
+    """Fetch get_series_info for one series, revalidating with the cached (etag, last_modified) if given.
+
+    Returns (metadata, (etag, last_modified)); metadata is NOT_MODIFIED on a 304 and None on failure.
+    """
+    base_url = server['url'].strip()
+    if not base_url.startswith(('http://', 'https://')):
+        base_url = 'http://' + base_url
+    port = server.get('port', 80)
+    if port and port not in (80, 443) and ':' not in base_url.split('://', 1)[1]:
+        base_url = f"{base_url}:{port}"
+    base_url = base_url.rstrip('/')
+    url = f"{base_url}/player_api.php?username={server['username']}&password={server['password']}&action=get_series_info&series_id={series_id}"
+
+    etag, last_modified = validators
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    response = None
+    try:
+        # Only real requests spend a token, so cache hits never wait; retries are handled by the session's adapter
+        _rate_limiter_for(server).acquire()
+        start_time = time.time()
+        logger.info(f"Fetching metadata for series_id {series_id}. URL: {url}")
+        response = _get_session().get(url, headers=headers, timeout=30, verify=False)
+        end_time = time.time()
+
+        response_size = len(response.content)
+        logger.info(f"Received response for series_id {series_id}. Status: {response.status_code}, Time: {end_time - start_time:.2f}s, Size: {response_size} bytes")
+        if response.status_code == 304:
+            return NOT_MODIFIED, validators
+        response.raise_for_status()
+
+        # Parse the raw bytes directly rather than decoding them to text first
+        json_response = json.loads(response.content)
+        if isinstance(json_response, list):
+            logger.warning(f"API response for series_id {series_id} is a list, expected a dictionary. Response: {json_response}")
+            return None, (None, None)
+        return json_response, (response.headers.get("ETag"), response.headers.get("Last-Modified"))
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Network error fetching metadata for series_id {series_id}: {e}")
+        return None, (None, None)
+    except ValueError as e: # Catches JSON decoding errors
+        logger.warning(f"JSON decoding error for series_id {series_id}: {e}. Response text: {response.text if response is not None else ''}")
+        return None, (None, None)
+    except Exception as e:
+        logger.warning(f"An unexpected error occurred fetching metadata for series_id {series_id}: {e}")
+        return None, (None, None)
 
-def load_cache(stream_id):
-    cache_file = CACHE_DIR / f"{stream_id}.pkl"
-    if cache_file.exists():
-        try:
-            with open(cache_file, "rb") as f:
-                return pickle.load(f)
-        except Exception:
+def load_cache(series_id, newer_than=0):
+    """Return the cached response for series_id if it was fetched after newer_than (epoch seconds)."""
+    try:
+        row = _get_cache_conn().execute(
+            "SELECT payload FROM series_cache WHERE series_id=? AND fetched_at > ?", (series_id, newer_than)
+        ).fetchone()
+        if row is None:
             return None
-    return None
+        return json.loads(zlib.decompress(row[0]))
+    except Exception:
+        return None
 
-def save_cache(series_id, data):
-    cache_file = CACHE_DIR / f"{series_id}.pkl"
+def load_cache_validators(series_id):
+    """Return the (etag, last_modified) headers stored with series_id's cached response, fresh or not."""
+    try:
+        row = _get_cache_conn().execute(
+            "SELECT etag, last_modified FROM series_cache WHERE series_id=?", (series_id,)
+        ).fetchone()
+        return tuple(row) if row else (None, None)
+    except Exception:
+        return (None, None)
+
+def save_cache(series_id, data, validators=(None, None)):
     try:
-        with open(cache_file, "wb") as f:
-            pickle.dump(data, f)
+        _get_cache_conn().execute(
+            "INSERT OR REPLACE INTO series_cache (series_id, fetched_at, payload, etag, last_modified) VALUES (?, ?, ?, ?, ?)",
+            (series_id, int(time.time()), zlib.compress(json.dumps(data).encode(), 3), *validators)
+        )
     except Exception as e:
         logger.warning(f"Failed to save cache for series_id {series_id}: {e}")
 
+def touch_cache(series_id):
+    """Mark a cached response as fresh again after the server confirmed it is unchanged."""
+    try:
+        _get_cache_conn().execute("UPDATE series_cache SET fetched_at=? WHERE series_id=?", (int(time.time()), series_id))
+    except Exception as e:
+        logger.warning(f"Failed to refresh cache for series_id {series_id}: {e}")
+
+def ensure_unique_episode_index(db_path):
+    """Create the unique (server_id, episode_id) index on databases that predate it."""
+    conn = _get_conn(db_path)
+    try:
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_episodes_unique_episode ON episodes(server_id, episode_id)")
+    except sqlite3.IntegrityError:
+        # Older imports could store the same episode twice; keep the first copy of each
+        logger.info("Removing duplicate episodes before creating unique index")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("""
+                DELETE FROM episodes WHERE id NOT IN (
+                    SELECT MIN(id) FROM episodes GROUP BY server_id, episode_id
+                )
+            """)
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_episodes_unique_episode ON episodes(server_id, episode_id)")
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+
+def _flush_series_writes(db_path, batch):
+    """Write a batch of series updates and their episodes in one transaction; returns (updated, inserted)."""
+    if not batch:
+        return 0, 0
+    updated_total = 0
+    inserted_total = 0
+    conn = _get_conn(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        now = int(time.time())
+        for series_id, series_params, episode_rows in batch:
+            updated_series = conn.execute(SERIES_UPDATE_SQL, series_params).rowcount
+            inserted_episodes = 0
+
+            # Episodes already stored are skipped by the unique (server_id, episode_id) index
+            if episode_rows:
+                cursor = conn.executemany("""
+                    INSERT OR IGNORE INTO episodes (
+                        server_id, series_id, season_num, episode_id, title, plot, duration, airdate,
+                        container_extension, episode_num, rating, crew, tmdb_id, movie_image, duration_secs,
+                        video, audio, bitrate, custom_sid, added, direct_source, season
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, episode_rows)
+                inserted_episodes = cursor.rowcount
+
+            # Update the last_modified timestamp in the series table
+            if updated_series > 0 or inserted_episodes > 0:
+                conn.execute("UPDATE series SET last_modified = ? WHERE series_id = ?", (now, series_id))
+            updated_total += updated_series
+            inserted_total += inserted_episodes
+        conn.commit()
+    except Exception as e:
+        logger.error(f"Error while saving metadata for {len(batch)} series: {e}")
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    return updated_total, inserted_total
+
+def db_writer(db_path, write_queue, result):
+    """Apply queued series writes on one connection, committing them in batches until a None sentinel arrives."""
+    stopping = False
+    while not stopping:
+        batch = []
+        episodes = 0
+        item = write_queue.get()
+        deadline = time.monotonic() + WRITE_BATCH_SECONDS
+        while True:
+            if item is None:
+                stopping = True
+                break
+            batch.append(item)
+            episodes += len(item[2])
+            if episodes >= EPISODE_BATCH_SIZE or len(batch) >= EPISODE_BATCH_SIZE:
+                break
+            try:
+                item = write_queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+
+        if not batch:
+            continue
+        start = time.perf_counter()
+        try:
+            updated, inserted = _flush_series_writes(db_path, batch)
+            result["updated"] += updated
+            result["inserted"] += inserted
+        except Exception:
+            # Already logged and rolled back; keep draining the queue so later series are still written
+            result["failed"] += len(batch)
+        result["batch_ms"].append((time.perf_counter() - start) * 1000)
+
 def get_series(db_path):
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT series_id, server_id, last_modified FROM series")
-    series = cursor.fetchall()
-    conn.close()
-    return series
-
-def get_server_info(db_path, server_id):
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM servers WHERE id=?", (server_id,))
-    row = cursor.fetchone()
-    conn.close()
-    return dict(row) if row else None
+    # Plain tuples: callers unpack them positionally, so sqlite3.Row would only add overhead
+    return _get_conn(db_path).execute("SELECT series_id, server_id, last_modified FROM series").fetchall()
+
+def get_servers(db_path):
+    """Load every server once, keyed by id."""
+    cursor = _get_conn(db_path).cursor()
+    cursor.row_factory = sqlite3.Row
+    cursor.execute("SELECT * FROM servers")
+    return {row["id"]: dict(row) for row in cursor.fetchall()}
 
 def normalize_value(value, key):
     if isinstance(value, list):
@@ -120,8 +353,13 @@ def normalize_value(value, key):
         return ''
     return value
 
-def update_series(db_path, series_id, metadata):
+def build_series_update_params(series_id, metadata):
+    """Flatten API metadata into the SERIES_UPDATE_SQL parameter tuple."""
     info = metadata.get("info", {})
+    if not isinstance(info, dict):
+        # Some providers send "info": [] for series without details
+        logger.warning(f"Series info for series_id {series_id} is not a dictionary, storing empty details.")
+        info = {}
     flattened = {
         "rating_5based": info.get("rating_5based"),
         "backdrop_path": info.get("backdrop_path")[0] if info.get("backdrop_path") else "",
@@ -132,24 +370,7 @@ def update_series(db_path, series_id, metadata):
         "category_ids": ','.join(str(cid) for cid in info.get("category_ids", []))
     }
 
-    set_clauses = []
-    params = []
-
-    for key in SERIES_UPDATE_COLUMNS:
-        value = normalize_value(flattened.get(key), key)
-        set_clauses.append(f"{key}=?")
-        params.append(value)
-
-    params.append(series_id)
-    sql_query = f"UPDATE series SET {', '.join(set_clauses)} WHERE series_id=?"
-
-    conn = sqlite3.connect(db_path)
-    conn.execute("PRAGMA journal_mode=WAL")
-    cursor = conn.cursor()
-    cursor.execute(sql_query, params)
-    conn.commit()
-    conn.close()
-    return cursor.rowcount
+    return tuple([normalize_value(flattened.get(key), key) for key in SERIES_UPDATE_COLUMNS]) + (series_id,)
 
 def insert_episode(cursor, server_id, series_id, season_num, episode):
     cursor.execute("SELECT 1 FROM episodes WHERE episode_id=?", (episode["id"],))
@@ -185,156 +406,155 @@ def insert_episode(cursor, server_id, series_id, season_num, episode):
     )
     return params
 
-def process_series(db_path, index, series_tuple, total_series):
+def process_series(index, series_tuple, total_series, servers, write_queue):
     series_id, server_id, last_modified_str = series_tuple
-    server = get_server_info(db_path, server_id)
+    server = servers.get(server_id)
     if not server:
         logger.warning(f"Server {server_id} not found, skipping series_id {series_id}")
-        return 0, 0
+        return SeriesResult(0, 0, 0, 0, 0.0)
 
-    cache_file = CACHE_DIR / f"{series_id}.pkl"
-    metadata = None
-    use_cache = False
-
-    if cache_file.exists():
-        cache_mod_time = datetime.fromtimestamp(cache_file.stat().st_mtime)
-        if last_modified_str:
-            last_modified = datetime.fromtimestamp(int(last_modified_str))
-            if cache_mod_time > last_modified:
-                use_cache = True
-        else:
-            use_cache = True
-
-    if use_cache:
-        metadata = load_cache(series_id)
+    # A cached response is only reused if it was fetched after the series last changed
+    metadata = load_cache(series_id, int(last_modified_str) if last_modified_str else 0)
+    cache_hit = int(metadata is not None)
+    revalidated = fetched_count = 0
+    fetch_ms = 0.0
 
     if metadata is None:
-        metadata = fetch_series_metadata(server, series_id)
-        if metadata:
-            save_cache(series_id, metadata)
-        time.sleep(RATE_LIMIT_DELAY)
-
-    updated_series = 0
-    inserted_episodes = 0
+        start = time.perf_counter()
+        # A stale entry can still be revalidated: a 304 means its payload is current
+        fetched, validators = fetch_series_metadata(server, series_id, load_cache_validators(series_id))
+        if fetched is NOT_MODIFIED:
+            metadata = load_cache(series_id)
+            if metadata is not None:
+                touch_cache(series_id)
+                revalidated = 1
+            else:
+                # The cached payload is unreadable, so fetch it again in full
+                fetched, validators = fetch_series_metadata(server, series_id)
+        if fetched and fetched is not NOT_MODIFIED:
+            metadata = fetched
+            fetched_count = 1
+            save_cache(series_id, metadata, validators)
+        fetch_ms = (time.perf_counter() - start) * 1000
 
     if metadata and isinstance(metadata, dict): # Ensure metadata is a dictionary
-        updated_series = update_series(db_path, series_id, metadata)
-
-        # Fetch existing episode IDs for this series once
-        existing_episode_ids = set()
-        conn_check = sqlite3.connect(db_path)
-        cursor_check = conn_check.cursor()
-        cursor_check.execute("SELECT episode_id FROM episodes WHERE series_id=?", (series_id,))
-        for row in cursor_check.fetchall():
-            existing_episode_ids.add(row[0])
-        conn_check.close()
-
-        # Batch insert episodes
+        # Build the series and episode rows here so the writer thread only executes SQL
+        series_params = build_series_update_params(series_id, metadata)
         episodes_to_insert = []
         episodes_data = metadata.get("episodes", {})
         if isinstance(episodes_data, dict):
             for season_num, episodes_list in episodes_data.items():
+                season = int(season_num) # Ensure season_num is int
                 for episode in episodes_list:
                     if not isinstance(episode, dict):
                         logger.warning(f"Skipping non-dictionary episode item in series {series_id}: {episode}")
                         continue
-                    
+                    if "id" not in episode:
+                        continue
+
                     info = episode.get("info", {})
                     if not isinstance(info, dict):
                         info = {}
 
-                    if "id" in episode and episode["id"] not in existing_episode_ids:
-                        video_codec = episode.get("video", {}).get("codec_name", "")
-                        audio_channels = episode.get("audio", {}).get("channels", "")
-
-                        params = (
-                            server_id,
-                            series_id,
-                            int(season_num), # Ensure season_num is int
-                            episode["id"],
-                            episode.get("title", ""),
-                            info.get("plot", ""),
-                            episode.get("duration", ""),
-                            info.get("air_date", ""),
-                            episode.get("container_extension", ""),
-                            episode.get("episode_num", 0),
-                            info.get("rating", 0),
-                            info.get("crew", ""),
-                            str(info.get("id", "")),
-                            info.get("movie_image", ""),
-                            info.get("duration_secs", 0),
-                            video_codec,
-                            audio_channels,
-                            episode.get("bitrate", 0),
-                            episode.get("custom_sid", ""),
-                            episode.get("added", ""),
-                            episode.get("direct_source", ""),
-                            episode.get("season", int(season_num)) # Ensure season is int
-                        )
-                        episodes_to_insert.append(params)
+                    # Bind the lookups once; the row below reads ~20 fields per episode
+                    get = episode.get
+                    info_get = info.get
+                    episodes_to_insert.append((
+                        server_id,
+                        series_id,
+                        season,
+                        episode["id"],
+                        get("title", ""),
+                        info_get("plot", ""),
+                        get("duration", ""),
+                        info_get("air_date", ""),
+                        get("container_extension", ""),
+                        get("episode_num", 0),
+                        info_get("rating", 0),
+                        info_get("crew", ""),
+                        str(info_get("id", "")),
+                        info_get("movie_image", ""),
+                        info_get("duration_secs", 0),
+                        (get("video") or {}).get("codec_name", ""),
+                        (get("audio") or {}).get("channels", ""),
+                        get("bitrate", 0),
+                        get("custom_sid", ""),
+                        get("added", ""),
+                        get("direct_source", ""),
+                        get("season", season)
+                    ))
         else:
             logger.warning(f"Episodes data for series {series_id} is not a dictionary, skipping episode processing.")
 
-        if episodes_to_insert:
-            conn = sqlite3.connect(db_path)
-            conn.execute("PRAGMA journal_mode=WAL")
-            cursor = conn.cursor()
-            try:
-                cursor.executemany("""
-                    INSERT INTO episodes (
-                        server_id, series_id, season_num, episode_id, title, plot, duration, airdate,
-                        container_extension, episode_num, rating, crew, tmdb_id, movie_image, duration_secs,
-                        video, audio, bitrate, custom_sid, added, direct_source, season
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, episodes_to_insert)
-                conn.commit()
-                inserted_episodes = cursor.rowcount
-            except sqlite3.Error as e:
-                logger.error(f"SQLite error during batch episode insert for series_id {series_id}: {e}")
-                conn.rollback()
-            finally:
-                conn.close()
-
-        # Update the last_modified timestamp in the series table
-        if updated_series > 0 or inserted_episodes > 0:
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            cursor.execute("UPDATE series SET last_modified = ? WHERE series_id = ?", (int(datetime.now().timestamp()), series_id))
-            conn.commit()
-            conn.close()
-
-        logger.info(f"[{index}/{total_series}] Series {series_id} updated: {updated_series}, Episodes added: {inserted_episodes}")
+        # The single writer thread owns all database writes
+        write_queue.put((series_id, series_params, episodes_to_insert))
+        logger.info(f"[{index}/{total_series}] Queued series {series_id} with {len(episodes_to_insert)} episodes")
+        return SeriesResult(1, cache_hit, revalidated, fetched_count, fetch_ms)
     else:
         logger.info(f"[{index}/{total_series}] No metadata available for series_id {series_id}")
+        return SeriesResult(0, cache_hit, revalidated, fetched_count, fetch_ms)
 
-    return updated_series, inserted_episodes
+def _percentile(values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    return values[min(len(values) - 1, int(len(values) * fraction))]
 
 def main():
     logger.info("Starting series metadata update")
+    ensure_unique_episode_index(DB_PATH)
 
     series_list = get_series(DB_PATH)
     total_series = len(series_list)
+    servers = get_servers(DB_PATH)
     print(f"Found {total_series} series to process", flush=True)
 
-    total_updated_series = 0
-    total_inserted_episodes = 0
     has_errors = False
+    write_queue = queue.Queue()
+    writer_result = {"updated": 0, "inserted": 0, "failed": 0, "batch_ms": []}
+    totals = SeriesResult(0, 0, 0, 0, 0.0)
+    writer = threading.Thread(target=db_writer, args=(DB_PATH, write_queue, writer_result), name="series-metadata-writer")
+    writer.start()
 
-    with ThreadPoolExecutor(max_workers=THREAD_WORKERS) as executor:
-        futures = {executor.submit(process_series, DB_PATH, i+1, series_tuple, total_series): series_tuple for i, series_tuple in enumerate(series_list)}
-        for future in as_completed(futures):
-            series_tuple = futures[future]
-            series_id = series_tuple[0]
-            try:
-                updated_series, inserted_episodes = future.result()
-                total_updated_series += updated_series
-                total_inserted_episodes += inserted_episodes
-            except Exception as e:
-                import traceback
-                logger.error(f"Error processing series {series_id}: {e}")
-                traceback.print_exc()
-                has_errors = True
-
+    try:
+        with ThreadPoolExecutor(max_workers=THREAD_WORKERS) as executor:
+            # Sliding window: only MAX_IN_FLIGHT futures exist at once, topped up as each one finishes
+            in_flight = {}
+            pending = iter(enumerate(series_list, 1))
+            while True:
+                for i, series_tuple in pending:
+                    future = executor.submit(process_series, i, series_tuple, total_series, servers, write_queue)
+                    in_flight[future] = series_tuple[0]
+                    if len(in_flight) >= MAX_IN_FLIGHT:
+                        break
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    series_id = in_flight.pop(future)
+                    try:
+                        totals = SeriesResult(*map(add, totals, future.result()))
+                    except Exception as e:
+                        import traceback
+                        logger.error(f"Error processing series {series_id}: {e}")
+                        traceback.print_exc()
+                        has_errors = True
+    finally:
+        # Sentinel: flush whatever is left and stop the writer
+        write_queue.put(None)
+        writer.join()
+
+    total_updated_series = writer_result["updated"]
+    total_inserted_episodes = writer_result["inserted"]
+    if writer_result["failed"]:
+        has_errors = True
+
+    _close_connections()
+    logger.info(
+        f"Series queued: {totals.queued}, cache hits: {totals.cache_hit}, revalidated (304): {totals.revalidated}, "
+        f"downloaded: {totals.fetched}, time spent fetching: {totals.fetch_ms / 1000:.1f} s"
+    )
+    batch_ms = sorted(writer_result["batch_ms"])
+    if batch_ms:
+        logger.info(f"Write batches: {len(batch_ms)}, p50 {_percentile(batch_ms, 0.5):.1f} ms, p95 {_percentile(batch_ms, 0.95):.1f} ms")
     print(f"Series metadata update completed: total series updated {total_updated_series}, total episodes added {total_inserted_episodes}", flush=True)
 
     return not has_errors
@@ -17,7 +17,18 @@ def vacuum_database():
     conn = None # Initialize conn
     try:
         conn = sqlite3.connect(DB_PATH)
-        conn.execute("VACUUM")
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            # auto_vacuum only takes effect after a rebuild, so older databases get one last full VACUUM
+            logger.info("Enabling incremental auto-vacuum (one-time full VACUUM)")
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+        else:
+            # Hand the free pages back to the filesystem without rewriting the whole file
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            # executescript steps the pragma to completion; a cursor would stop after the first page
+            conn.executescript(f"PRAGMA incremental_vacuum({free_pages});")
+            logger.info(f"Released {free_pages} free pages ({free_pages * page_size / (1024*1024):.2f} MB)")
         conn.close()
         size_after = get_db_size(DB_PATH)
         logger.info(f"Size after VACUUM: {size_after / (1024*1024):.2f} MB")
@@ -1,55 +1,188 @@
 import sys
+import queue
+from functools import lru_cache
+import threading
+from collections import deque
+from time import monotonic
 import backend
-from datetime import datetime, time
+from datetime import datetime, timedelta
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QFormLayout,
-    QGroupBox, QLineEdit, QPushButton, QScrollArea, QCheckBox, QTimeEdit,
-    QWizard, QWizardPage, QLabel, QPlainTextEdit, QSizePolicy, QSystemTrayIcon, QMenu, QTabWidget,
-    QListWidget, QListWidgetItem
+    QGroupBox, QLineEdit, QPushButton, QCheckBox, QTimeEdit,
+    QLabel, QSizePolicy, QSystemTrayIcon, QMenu, QTabWidget,
+    QListWidget, QListWidgetItem, QListView
 )
-from PySide6.QtCore import QThread, QObject, Signal, Slot, Qt, QTime, QTimer
+from PySide6.QtCore import QThread, QObject, Signal, Slot, Qt, QTime, QTimer, QAbstractListModel, QModelIndex
 from PySide6.QtGui import QPalette, QColor, QPixmap, QIcon, QAction
 
-# --- Worker thread for running backend tasks ---
+LOGO_PATH = "assets/FLB.png"
+# Decoded once by load_assets() after the QApplication exists, then shared by every widget
+FLB_PIXMAP = None
+FLB_PIXMAP_128 = None
+FLB_ICON = None
+
+PROGRESS_INTERVAL = 1 / 30 # Seconds between progress signals, caps GUI updates at ~30 Hz
+# Longest the schedule timer waits before re-checking the wall clock, so sleep or clock changes can't skip a run
+SCHEDULE_CHECK_MAX_MS = 5 * 60 * 1000
+# Preference holding the time up to which every scheduled slot has been run or deliberately skipped
+SCHEDULE_HANDLED_PREFERENCE = "schedule_handled_until"
+# How long shutdown waits for a cancelled task to reach its next step before giving up on the worker thread
+WORKER_STOP_TIMEOUT_MS = 10 * 1000
+
+class TaskCancelled(BaseException):
+    # BaseException so the backend's per-step `except Exception` handlers don't report it as a failure
+    pass
+
+# --- Worker for running backend tasks on a long-lived thread ---
 class Worker(QObject):
     progress = Signal(str)
+    error = Signal(str) # Full traceback of a failed task, emitted just before finished(False)
     finished = Signal(bool)
+    task_queued = Signal()
 
-    def __init__(self, task_func, *args):
+    def __init__(self):
         super().__init__()
-        self.task_func = task_func
-        self.args = args
-        self.exception_info = None # New attribute to store exception details
+        self.task_func = None
+        self.args = ()
+        # Tasks run one at a time, in order, each delivered to run() by a queued task_queued signal
+        self._tasks = queue.Queue()
+        self.task_queued.connect(self.run)
+        # Set from the GUI thread on shutdown; the running task stops at its next progress report
+        self._cancel_requested = threading.Event()
+        # Progress messages are buffered and emitted newline-joined at most every PROGRESS_INTERVAL
+        self._pending_progress = deque()
+        self._progress_lock = threading.Lock()
+        self._progress_timer = None
+        self._last_progress = 0.0
+
+    def report_progress(self, message):
+        if self._cancel_requested.is_set():
+            raise TaskCancelled()
+        with self._progress_lock:
+            self._pending_progress.append(message)
+            if self._progress_timer is not None:
+                return
+            delay = self._last_progress + PROGRESS_INTERVAL - monotonic()
+            if delay > 0:
+                # The worker thread is busy in task_func, so flush from a timer thread instead
+                self._progress_timer = threading.Timer(delay, self.flush_progress)
+                self._progress_timer.daemon = True
+                self._progress_timer.start()
+                return
+        self.flush_progress()
+
+    def enqueue(self, task_func, *args):
+        self._tasks.put((task_func, args))
+        self.task_queued.emit()
+
+    def cancel(self):
+        self._cancel_requested.set()
+        # Tasks that haven't started yet are simply dropped
+        while True:
+            try:
+                self._tasks.get_nowait()
+            except queue.Empty:
+                break
+
+    def flush_progress(self):
+        with self._progress_lock:
+            if self._progress_timer is not None:
+                self._progress_timer.cancel()
+                self._progress_timer = None
+            if self._pending_progress:
+                message = "\n".join(self._pending_progress)
+                self._pending_progress.clear()
+                self._last_progress = monotonic()
+                self.progress.emit(message)
 
     @Slot()
     def run(self):
         try:
-            success = self.task_func(*self.args, progress_callback=self.progress.emit)
+            self.task_func, self.args = self._tasks.get_nowait()
+        except queue.Empty:
+            return # Dropped by cancel()
+        try:
+            success = self.task_func(*self.args, progress_callback=self.report_progress)
+            self.flush_progress()
             self.finished.emit(success)
+        except TaskCancelled:
+            self.finished.emit(False)
         except Exception as e:
             import traceback
-            self.exception_info = traceback.format_exc() # Store full traceback
-            self.progress.emit(f"An error occurred: {e}") # Still emit a short message
+            self.report_progress(f"An error occurred: {e}") # Still emit a short message
+            self.flush_progress()
+            self.error.emit(traceback.format_exc()) # Full traceback
             self.finished.emit(False)
 
+# --- Checkable list model for category visibility ---
+class CategoryModel(QAbstractListModel):
+    def __init__(self, categories, parent=None):
+        super().__init__(parent)
+        self._rows = []
+        self._dirty_rows = set()
+        self.load(categories)
+
+    def load(self, categories):
+        # One reset for the whole list instead of a change notification per row
+        self.beginResetModel()
+        # One (id, name, visible) tuple per category; the view only creates items for rows on screen
+        self._rows = [(cat['id'], cat['category_name'], bool(cat['visible'])) for cat in categories]
+        self._dirty_rows.clear()
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        cat_id, name, visible = self._rows[index.row()]
+        if role == Qt.DisplayRole:
+            return name
+        if role == Qt.CheckStateRole:
+            return Qt.Checked if visible else Qt.Unchecked
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsUserCheckable
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.CheckStateRole or not index.isValid():
+            return False
+        row = index.row()
+        cat_id, name, _ = self._rows[row]
+        self._rows[row] = (cat_id, name, Qt.CheckState(value) == Qt.Checked)
+        self._dirty_rows.add(row)
+        self.dataChanged.emit(index, index, [Qt.CheckStateRole])
+        return True
+
+    def dirty_updates(self):
+        """Returns (visible, category_id) pairs for the rows changed since the last save."""
+        return [(1 if self._rows[row][2] else 0, self._rows[row][0]) for row in self._dirty_rows]
+
+    def mark_clean(self):
+        self._dirty_rows.clear()
+
 # --- Main Application Window ---
 class FynixPlayerWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Fynix Library Builder")
         self.setMinimumSize(800, 600)
-        self.thread = None
-        self.worker = None
-        self.category_checkboxes = []
+        self.category_models = []
         self.live_category_checkboxes = {}
         self.live_channel_checkboxes = {}
         self.server_editors = {}
-        self.last_auto_update_date = None
         self.process_live_tv_checkbox = None # Initialize to None
+        # Edits since the last save; save_all_changes only writes these
+        self.dirty_server_ids = set()
+        self.dirty_sections = set()
 
         # --- System Tray Icon ---
         self.tray_icon = QSystemTrayIcon(self)
-        self.tray_icon.setIcon(QIcon("assets/FLB.png"))
+        self.tray_icon.setIcon(FLB_ICON)
         self.tray_icon.setToolTip("Fynix Library Builder")
 
         tray_menu = QMenu()
@@ -61,6 +194,20 @@ class FynixPlayerWindow(QMainWindow):
         self.tray_icon.activated.connect(self.on_tray_icon_activated)
         self.tray_icon.show()
 
+        backend.ensure_category_type_index()
+
+        # --- Background worker, started once and reused for every task ---
+        self.pending_tasks = 0
+        self.last_task_error = None
+        self.worker_thread = QThread(self)
+        self.worker = Worker()
+        self.worker.moveToThread(self.worker_thread)
+        self.worker.progress.connect(self.update_status)
+        self.worker.error.connect(self.store_task_error)
+        self.worker.finished.connect(self.task_finished)
+        self.worker_thread.start()
+        QApplication.instance().aboutToQuit.connect(self.stop_worker_thread)
+
         # --- Tab Widget ---
         self.tabs = QTabWidget()
         self.setCentralWidget(self.tabs)
@@ -83,6 +230,9 @@ class FynixPlayerWindow(QMainWindow):
         if not backend.check_live_streams_visible_column_exists():
             self.run_task(backend.migrate_add_visible_column_to_live_streams)
 
+        # Catch up on a scheduled update missed while the app was closed; queued after the migrations
+        self.run_scheduled_update_if_due()
+
     def build_dashboard_tab(self):
         dashboard_widget = QWidget()
         main_layout = QHBoxLayout(dashboard_widget)
@@ -97,8 +247,7 @@ class FynixPlayerWindow(QMainWindow):
 
         # Logo
         logo_label = QLabel()
-        pixmap = QPixmap("assets/FLB.png")
-        logo_label.setPixmap(pixmap.scaled(128, 128, Qt.KeepAspectRatio, Qt.SmoothTransformation))
+        logo_label.setPixmap(FLB_PIXMAP_128)
         logo_label.setAlignment(Qt.AlignCenter)
         left_column.addWidget(logo_label)
 
@@ -148,6 +297,7 @@ class FynixPlayerWindow(QMainWindow):
         
         # Populate categories
         live_categories = backend.get_live_categories()
+        self.live_categories_list.setUpdatesEnabled(False) # Lay out once after all rows are added
         for category in live_categories:
             item = QListWidgetItem(self.live_categories_list)
             checkbox = QCheckBox(category['category_name'])
@@ -156,6 +306,7 @@ class FynixPlayerWindow(QMainWindow):
             self.live_categories_list.setItemWidget(item, checkbox)
             # Store a reference to the item and its corresponding category ID
             self.live_category_checkboxes[category['id']] = (item, checkbox, category['category_id'])
+        self.live_categories_list.setUpdatesEnabled(True)
 
 
         # Right side: Channels
@@ -200,6 +351,7 @@ class FynixPlayerWindow(QMainWindow):
         self.live_channel_checkboxes.clear()
         
         streams = backend.get_live_streams_by_category(provider_category_id)
+        self.live_channels_list.setUpdatesEnabled(False) # Lay out once after all rows are added
         for stream in streams:
             list_item = QListWidgetItem(self.live_channels_list)
             checkbox = QCheckBox(stream['name'])
@@ -207,6 +359,7 @@ class FynixPlayerWindow(QMainWindow):
             list_item.setSizeHint(checkbox.sizeHint())
             self.live_channels_list.setItemWidget(list_item, checkbox)
             self.live_channel_checkboxes[stream['id']] = checkbox
+        self.live_channels_list.setUpdatesEnabled(True)
 
     def select_all_live_channels(self):
         for checkbox in self.live_channel_checkboxes.values():
@@ -283,6 +436,9 @@ class FynixPlayerWindow(QMainWindow):
         self.series_path_editor.setText(paths.get('series', ''))
         self.live_tv_path_editor.setText(paths.get('live_tv', '')) # Assuming 'live_tv' key
 
+        for editor in (self.movie_path_editor, self.series_path_editor, self.live_tv_path_editor):
+            editor.textEdited.connect(lambda _text: self.dirty_sections.add('directories'))
+
         return group
 
     def build_server_editor(self):
@@ -314,6 +470,8 @@ class FynixPlayerWindow(QMainWindow):
             layout.addLayout(form_layout)
 
             self.server_editors[server_id] = editors
+            for editor in editors.values():
+                editor.textEdited.connect(lambda _text, sid=server_id: self.dirty_server_ids.add(sid))
 
             # Add Migrate DB button if tables are missing
             if backend.check_for_missing_tables():
@@ -328,27 +486,16 @@ class FynixPlayerWindow(QMainWindow):
         group = QGroupBox(title)
         group.setToolTip(description)
         
-        scroll_area = QScrollArea()
-        scroll_area.setWidgetResizable(True)
-        
-        container = QWidget()
-        layout = QVBoxLayout(container)
-        scroll_area.setWidget(container)
-
-        layout.addWidget(QLabel(description))
-
-        categories = backend.get_categories()
-        for cat in categories:
-            if cat['content_type'] == content_type:
-                check = QCheckBox(cat['category_name'])
-                check.setChecked(bool(cat['visible']))
-                self.category_checkboxes.append((cat['id'], check))
-                layout.addWidget(check)
-        
-        layout.addStretch()
+        model = CategoryModel(backend.get_categories(content_type), self)
+        self.category_models.append(model)
+
+        list_view = QListView()
+        list_view.setUniformItemSizes(True)
+        list_view.setModel(model)
 
         main_layout = QVBoxLayout(group)
-        main_layout.addWidget(scroll_area)
+        main_layout.addWidget(QLabel(description))
+        main_layout.addWidget(list_view)
         return group
 
     def build_actions_box(self):
@@ -373,6 +520,7 @@ class FynixPlayerWindow(QMainWindow):
         # New checkbox for Live TV processing
         self.process_live_tv_checkbox = QCheckBox("Process Live TV")
         self.process_live_tv_checkbox.setToolTip("Include live streams and EPG data in library updates.")
+        self.process_live_tv_checkbox.clicked.connect(lambda _checked: self.dirty_sections.add('preferences'))
         layout.addWidget(self.process_live_tv_checkbox)
         
         self.status_label = QLabel("Ready.")
@@ -416,80 +564,141 @@ class FynixPlayerWindow(QMainWindow):
         self.stats_labels['episodes'].setText(f"{stats['visible_episodes']} / {stats['total_episodes']}")
 
     def save_all_changes(self):
-        # Save server details
-        for server_id, editors in self.server_editors.items():
-            backend.update_server(
-                server_id,
+        # Only edited servers and toggled categories are sent to the database
+        server_updates = [
+            (
                 editors['name'].text(),
                 editors['url'].text(),
                 editors['username'].text(),
                 editors['password'].text(),
-                editors['port'].text()
+                editors['port'].text(),
+                server_id
             )
+            for server_id, editors in self.server_editors.items()
+            if server_id in self.dirty_server_ids
+        ]
+        category_updates = [update for model in self.category_models for update in model.dirty_updates()]
+        if not (server_updates or category_updates or self.dirty_sections):
+            self.statusBar().showMessage("No changes to save.", 3000)
+            return
 
-        # Save category visibility
-        for cat_id, checkbox in self.category_checkboxes:
-            backend.update_category_visibility(cat_id, 1 if checkbox.isChecked() else 0)
-        
-        # Save directory paths
-        backend.config_manager.save_directories(
-            self.movie_path_editor.text(),
-            self.series_path_editor.text(),
-            self.live_tv_path_editor.text()
-        )
+        # Save server details, category visibility and schedule in one backend call
+        schedule = None
+        if 'schedule' in self.dirty_sections:
+            schedule_time = self.schedule_time_edit.time()
+            schedule = (self.schedule_checkbox.isChecked(), schedule_time.toString("HH:mm"))
+        saved = backend.save_all(server_updates, category_updates, schedule)
+        # Only re-arm once schedule.json holds the new schedule, so the timer never runs ahead of it
+        if schedule is not None and saved:
+            # A newly chosen time that has already passed today waits for tomorrow rather than firing now
+            self.mark_schedule_handled(max(self._schedule_handled_until, datetime.now()))
+            self.set_schedule(schedule[0], schedule_time)
 
-        # Save schedule
-        backend.save_schedule(
-            self.schedule_checkbox.isChecked(),
-            self.schedule_time_edit.time().toString("HH:mm")
-        )
+        # Save directory paths
+        if 'directories' in self.dirty_sections:
+            saved = backend.config_manager.save_directories(
+                self.movie_path_editor.text(),
+                self.series_path_editor.text(),
+                self.live_tv_path_editor.text()
+            ) and saved
 
         # Save "Process Live TV" preference
-        if self.process_live_tv_checkbox:
-            backend.save_preference("process_live_tv", self.process_live_tv_checkbox.isChecked())
-
-        self.statusBar().showMessage("All changes saved successfully!", 5000)
-        self.status_label.setText("Changes saved.")
+        if 'preferences' in self.dirty_sections and self.process_live_tv_checkbox:
+            saved = backend.save_preference("process_live_tv", self.process_live_tv_checkbox.isChecked()) and saved
+
+        if saved:
+            for model in self.category_models:
+                model.mark_clean()
+            self.dirty_server_ids.clear()
+            self.dirty_sections.clear()
+            self.statusBar().showMessage("All changes saved successfully!", 5000)
+            self.status_label.setText("Changes saved.")
+        else:
+            self.statusBar().showMessage("Some changes could not be saved. Check logs.", 5000)
+            self.status_label.setText("Save failed.")
         self.update_statistics_ui()
 
     def load_and_set_schedule(self):
         schedule = backend.load_schedule()
+        schedule_time = QTime.fromString(schedule['time'], "HH:mm")
         self.schedule_checkbox.setChecked(schedule['enabled'])
-        self.schedule_time_edit.setTime(QTime.fromString(schedule['time'], "HH:mm"))
+        self.schedule_time_edit.setTime(schedule_time)
 
+        # Single-shot timer armed for the next scheduled run; re-armed after it fires or on save
         self.schedule_timer = QTimer(self)
-        self.schedule_timer.timeout.connect(self.check_schedule)
-        self.schedule_timer.start(60000) # Check every 60 seconds
+        self.schedule_timer.setSingleShot(True)
+        self.schedule_timer.timeout.connect(self.on_scheduled_fire)
 
-    def check_schedule(self):
-        schedule = backend.load_schedule()
-        if not schedule['enabled']:
+        handled_until = backend.load_preference(SCHEDULE_HANDLED_PREFERENCE, None)
+        try:
+            self._schedule_handled_until = datetime.fromisoformat(handled_until)
+        except (TypeError, ValueError):
+            # No record yet: start counting from now instead of running a catch-up on first launch
+            self.mark_schedule_handled(datetime.now())
+        self.set_schedule(schedule['enabled'], schedule_time)
+
+        # Connected after the saved values are applied so loading doesn't count as an edit
+        self.schedule_checkbox.clicked.connect(lambda _checked: self.dirty_sections.add('schedule'))
+        self.schedule_time_edit.timeChanged.connect(lambda _time: self.dirty_sections.add('schedule'))
+
+    def set_schedule(self, enabled, schedule_time):
+        # Keep the schedule as minutes past midnight so arming the timer needs no string parsing
+        self._sched_enabled = enabled and schedule_time.isValid()
+        self._sched_minutes = schedule_time.hour() * 60 + schedule_time.minute()
+        self.arm_schedule_timer()
+
+    def mark_schedule_handled(self, until):
+        self._schedule_handled_until = until
+        backend.save_preference(SCHEDULE_HANDLED_PREFERENCE, until.isoformat(timespec='seconds'))
+
+    def latest_schedule_slot(self, now):
+        # Most recent scheduled time at or before now: today's if it has passed, otherwise yesterday's
+        slot = now.replace(hour=self._sched_minutes // 60, minute=self._sched_minutes % 60, second=0, microsecond=0)
+        if slot > now:
+            slot -= timedelta(days=1)
+        return slot
+
+    def arm_schedule_timer(self):
+        self.schedule_timer.stop()
+        if not self._sched_enabled:
             return
 
         now = datetime.now()
-        scheduled_time = datetime.strptime(schedule['time'], "%H:%M").time()
+        next_fire = self.latest_schedule_slot(now) + timedelta(days=1)
+        delay_ms = int((next_fire - now).total_seconds() * 1000)
+        # Capped so the wall clock is re-checked regularly; a long single delay drifts across system sleep
+        self.schedule_timer.start(max(1000, min(delay_ms, SCHEDULE_CHECK_MAX_MS)))
 
-        # Check if it's time to run and if it hasn't run today
-        if now.time() >= scheduled_time and now.date() != self.last_auto_update_date:
-            self.last_auto_update_date = now.date()
-            self.status_label.setText(f"Starting scheduled update at {now.strftime('%H:%M')}:")
-            self.run_library_update()
+    def on_scheduled_fire(self):
+        self.run_scheduled_update_if_due()
+        self.arm_schedule_timer()
 
-    def run_task(self, task_func, *args):
-        if self.thread is not None and self.thread.isRunning():
-            self.statusBar().showMessage("A task is already running.", 3000)
+    def run_scheduled_update_if_due(self):
+        if not self._sched_enabled:
             return
+        now = datetime.now()
+        if self._schedule_handled_until >= self.latest_schedule_slot(now):
+            return
+
+        self.mark_schedule_handled(now)
+        if self.pending_tasks:
+            # Queued behind the running task rather than dropped
+            self.statusBar().showMessage("Scheduled update queued after the running task.", 5000)
+        else:
+            self.status_label.setText(f"Starting scheduled update at {now.strftime('%H:%M')}:")
+        self.run_library_update()
 
+    def run_task(self, task_func, *args):
         self.set_buttons_enabled(False)
-        self.thread = QThread()
-        self.worker = Worker(task_func, *args)
-        self.worker.moveToThread(self.thread)
+        self.pending_tasks += 1
+        self.worker.enqueue(task_func, *args)
 
-        self.worker.progress.connect(self.update_status)
-        self.thread.started.connect(self.worker.run)
-        self.worker.finished.connect(self.task_finished)
-        
-        self.thread.start()
+    def stop_worker_thread(self):
+        self.worker.cancel()
+        self.worker_thread.quit()
+        if not self.worker_thread.wait(WORKER_STOP_TIMEOUT_MS):
+            # A single step can run for a long time without reporting progress; don't hang the exit on it
+            print(f"WARNING: Background task did not stop within {WORKER_STOP_TIMEOUT_MS // 1000} seconds, exiting anyway.", file=sys.stderr)
 
     def run_library_update(self):
         process_live_tv = False
@@ -502,13 +711,19 @@ class FynixPlayerWindow(QMainWindow):
 
     @Slot(str)
     def update_status(self, message):
-        self.status_label.setText(message)
+        # Coalesced batches arrive newline-joined; the label only needs the most recent line
+        lines = [line for line in message.splitlines() if line.strip()]
+        self.status_label.setText(lines[-1] if lines else message)
+
+    @Slot(str)
+    def store_task_error(self, traceback_text):
+        self.last_task_error = traceback_text
 
     @Slot(bool)
     def task_finished(self, success):
-        self.thread.quit()
-        self.thread.wait()
-        self.set_buttons_enabled(True)
+        self.pending_tasks -= 1
+        if not self.pending_tasks:
+            self.set_buttons_enabled(True)
         if success:
             self.status_label.setText("Task completed successfully.")
             self.statusBar().showMessage("Success!", 3000)
@@ -516,20 +731,13 @@ class FynixPlayerWindow(QMainWindow):
             # After migration, hide the button if successful
             if hasattr(self, 'migrate_db_button') and self.migrate_db_button.isVisible():
                 self.migrate_db_button.hide()
-            
-            # Update last_auto_update_date if the task was a library update
-            # This prevents immediate re-triggering if the app is kept open
-            # and the scheduled time is still in the past for the current day.
-            if self.worker and self.worker.task_func == backend.run_library_update:
-                self.last_auto_update_date = datetime.now().date()
         else:
             error_message = "Task failed. Check logs."
-            if self.worker and self.worker.exception_info: # Check if exception info is available
-                error_message = f"Task failed: {self.worker.exception_info}"
+            if self.last_task_error: # Check if exception info is available
+                error_message = f"Task failed: {self.last_task_error}"
                 print(f"ERROR: {error_message}", file=sys.stderr) # Print to stderr as well
             self.status_label.setText(error_message)
-        self.thread = None
-        self.worker = None
+        self.last_task_error = None
 
     def migrate_db(self):
         self.run_task(backend.migrate_database)
@@ -542,143 +750,167 @@ class FynixPlayerWindow(QMainWindow):
             self.migrate_db_button.setEnabled(enabled)
 
 # --- Initial Setup Wizard ---
-class SetupWizard(QWizard):
-    def __init__(self):
-        super().__init__()
-        self.setWindowTitle("Fynix Library Builder Setup")
-        self.addPage(self.create_welcome_page())
-        self.addPage(self.create_server_page())
-        self.addPage(self.create_folders_page())
-        self.addPage(self.create_confirm_page())
-
-    def create_welcome_page(self):
-        page = QWizardPage()
-        page.setTitle("Welcome")
-        layout = QVBoxLayout(page)
-        logo_label = QLabel()
-        pixmap = QPixmap("assets/FLB.png")
-        logo_label.setPixmap(pixmap.scaled(128, 128, Qt.KeepAspectRatio, Qt.SmoothTransformation))
-        logo_label.setAlignment(Qt.AlignCenter)
-        welcome_label = QLabel("Welcome to Fynix Library Builder.\n\nThis wizard will guide you through the initial setup.")
-        welcome_label.setAlignment(Qt.AlignCenter)
-        layout.addWidget(logo_label)
-        layout.addWidget(welcome_label)
-        return page
-
-    def create_server_page(self):
-        page = QWizardPage()
-        page.setTitle("Server Details")
-        page.setSubTitle("Enter the connection details for your IPTV provider.")
-        layout = QVBoxLayout(page)
-        self.server_name_entry = QLineEdit()
-        self.server_url_entry = QLineEdit()
-        self.server_user_entry = QLineEdit()
-        self.server_pass_entry = QLineEdit()
-        self.server_pass_entry.setEchoMode(QLineEdit.Password)
-        self.server_port_entry = QLineEdit("80")
-        
-        layout.addWidget(QLabel("A friendly name for your server (e.g., 'My Provider'):"))
-        layout.addWidget(self.server_name_entry)
-        layout.addWidget(QLabel("Server URL (e.g., http://myprovider.com:8080):"))
-        layout.addWidget(self.server_url_entry)
-        layout.addWidget(QLabel("Username:"))
-        layout.addWidget(self.server_user_entry)
-        layout.addWidget(QLabel("Password:"))
-        layout.addWidget(self.server_pass_entry)
-        layout.addWidget(QLabel("Port (usually 80 or 8080):"))
-        layout.addWidget(self.server_port_entry)
-        return page
-
-    def create_folders_page(self):
-        page = QWizardPage()
-        page.setTitle("Library Folders")
-        page.setSubTitle("Select the folders where your movie, series, and live TV .strm files will be saved.")
-        layout = QVBoxLayout(page)
-        self.movie_folder_entry = QLineEdit()
-        self.series_folder_entry = QLineEdit()
-        self.live_tv_folder_entry = QLineEdit() # New line for Live TV folder
-        # In a real app, these would be folder selection dialogs
-        layout.addWidget(QLabel("Movie Library Path:"))
-        layout.addWidget(self.movie_folder_entry)
-        layout.addWidget(QLabel("Series Library Path:"))
-        layout.addWidget(self.series_folder_entry)
-        layout.addWidget(QLabel("Live TV Library Path:")) # New label
-        layout.addWidget(self.live_tv_folder_entry) # New widget
-        return page
-
-    def create_confirm_page(self):
-        page = QWizardPage()
-        page.setTitle("Confirmation")
-        layout = QVBoxLayout(page)
-        layout.addWidget(QLabel("Ready to set up the library. This may take a long time."))
-        self.progress_text = QPlainTextEdit()
-        self.progress_text.setReadOnly(True)
-        layout.addWidget(self.progress_text)
-        return page
-
-    def accept(self):
-        # Disable finish button to prevent multiple clicks
-        self.button(QWizard.FinishButton).setEnabled(False)
-        self.button(QWizard.CancelButton).setEnabled(False)
-
-        server_details = (
-            self.server_name_entry.text(), self.server_url_entry.text(),
-            self.server_user_entry.text(), self.server_pass_entry.text(),
-            self.server_port_entry.text()
-        )
-        movie_path = self.movie_folder_entry.text()
-        series_path = self.series_folder_entry.text()
-        live_tv_path = self.live_tv_folder_entry.text() # New line for Live TV path
-
-        self.thread = QThread()
-        self.worker = Worker(backend.run_initial_setup, server_details, movie_path, series_path, live_tv_path) # Added live_tv_path
-        self.worker.moveToThread(self.thread)
-        self.worker.progress.connect(self.update_progress_text)
-        self.thread.started.connect(self.worker.run)
-        self.worker.finished.connect(self.task_finished)
-        self.thread.start()
-
-    @Slot(str)
-    def update_progress_text(self, msg):
-        self.progress_text.appendPlainText(msg)
-
-    @Slot(bool)
-    def task_finished(self, success):
-        # Cleanly shut down the thread
-        self.thread.quit()
-        self.thread.wait()
+def create_setup_wizard():
+    """Builds the first-run setup wizard, importing its widget classes only when it is needed."""
+    from PySide6.QtWidgets import QWizard, QWizardPage, QPlainTextEdit
+
+    class SetupWizard(QWizard):
+        def __init__(self):
+            super().__init__()
+            self.setWindowTitle("Fynix Library Builder Setup")
+            self.addPage(self.create_welcome_page())
+            self.addPage(self.create_server_page())
+            self.addPage(self.create_folders_page())
+            self.addPage(self.create_confirm_page())
+
+        def create_welcome_page(self):
+            page = QWizardPage()
+            page.setTitle("Welcome")
+            layout = QVBoxLayout(page)
+            logo_label = QLabel()
+            logo_label.setPixmap(FLB_PIXMAP_128)
+            logo_label.setAlignment(Qt.AlignCenter)
+            welcome_label = QLabel("Welcome to Fynix Library Builder.\n\nThis wizard will guide you through the initial setup.")
+            welcome_label.setAlignment(Qt.AlignCenter)
+            layout.addWidget(logo_label)
+            layout.addWidget(welcome_label)
+            return page
+
+        def create_server_page(self):
+            page = QWizardPage()
+            page.setTitle("Server Details")
+            page.setSubTitle("Enter the connection details for your IPTV provider.")
+            layout = QVBoxLayout(page)
+            self.server_name_entry = QLineEdit()
+            self.server_url_entry = QLineEdit()
+            self.server_user_entry = QLineEdit()
+            self.server_pass_entry = QLineEdit()
+            self.server_pass_entry.setEchoMode(QLineEdit.Password)
+            self.server_port_entry = QLineEdit("80")
+
+            layout.addWidget(QLabel("A friendly name for your server (e.g., 'My Provider'):"))
+            layout.addWidget(self.server_name_entry)
+            layout.addWidget(QLabel("Server URL (e.g., http://myprovider.com:8080):"))
+            layout.addWidget(self.server_url_entry)
+            layout.addWidget(QLabel("Username:"))
+            layout.addWidget(self.server_user_entry)
+            layout.addWidget(QLabel("Password:"))
+            layout.addWidget(self.server_pass_entry)
+            layout.addWidget(QLabel("Port (usually 80 or 8080):"))
+            layout.addWidget(self.server_port_entry)
+            return page
+
+        def create_folders_page(self):
+            page = QWizardPage()
+            page.setTitle("Library Folders")
+            page.setSubTitle("Select the folders where your movie, series, and live TV .strm files will be saved.")
+            layout = QVBoxLayout(page)
+            self.movie_folder_entry = QLineEdit()
+            self.series_folder_entry = QLineEdit()
+            self.live_tv_folder_entry = QLineEdit() # New line for Live TV folder
+            # In a real app, these would be folder selection dialogs
+            layout.addWidget(QLabel("Movie Library Path:"))
+            layout.addWidget(self.movie_folder_entry)
+            layout.addWidget(QLabel("Series Library Path:"))
+            layout.addWidget(self.series_folder_entry)
+            layout.addWidget(QLabel("Live TV Library Path:")) # New label
+            layout.addWidget(self.live_tv_folder_entry) # New widget
+            return page
+
+        def create_confirm_page(self):
+            page = QWizardPage()
+            page.setTitle("Confirmation")
+            layout = QVBoxLayout(page)
+            layout.addWidget(QLabel("Ready to set up the library. This may take a long time."))
+            self.progress_text = QPlainTextEdit()
+            self.progress_text.setReadOnly(True)
+            layout.addWidget(self.progress_text)
+            return page
+
+        def accept(self):
+            # Disable finish button to prevent multiple clicks
+            self.button(QWizard.FinishButton).setEnabled(False)
+            self.button(QWizard.CancelButton).setEnabled(False)
+
+            server_details = (
+                self.server_name_entry.text(), self.server_url_entry.text(),
+                self.server_user_entry.text(), self.server_pass_entry.text(),
+                self.server_port_entry.text()
+            )
+            movie_path = self.movie_folder_entry.text()
+            series_path = self.series_folder_entry.text()
+            live_tv_path = self.live_tv_folder_entry.text() # New line for Live TV path
+
+            self.worker_thread = QThread()
+            self.worker = Worker()
+            self.worker.moveToThread(self.worker_thread)
+            self.worker.progress.connect(self.update_progress_text)
+            self.worker.finished.connect(self.task_finished)
+            self.worker_thread.start()
+            self.worker.enqueue(backend.run_initial_setup, server_details, movie_path, series_path, live_tv_path) # Added live_tv_path
+
+        @Slot(str)
+        def update_progress_text(self, msg):
+            self.progress_text.appendPlainText(msg)
+
+        @Slot(bool)
+        def task_finished(self, success):
+            # Cleanly shut down the thread
+            self.worker_thread.quit()
+            self.worker_thread.wait()
+
+            if success:
+                # Now it's safe to close the wizard
+                super().accept()
+            else:
+                self.progress_text.appendPlainText("\n\nSetup failed. Please check logs and restart the application.")
+                # Re-enable buttons on failure
+                self.button(QWizard.FinishButton).setEnabled(True)
+                self.button(QWizard.CancelButton).setEnabled(True)
+
+    return SetupWizard()
+
+def load_assets():
+    global FLB_PIXMAP, FLB_PIXMAP_128, FLB_ICON
+    FLB_PIXMAP = QPixmap(LOGO_PATH)
+    FLB_PIXMAP_128 = FLB_PIXMAP.scaled(128, 128, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+    FLB_ICON = QIcon(FLB_PIXMAP)
+
+# --- Dark theme ---
+DARK_PALETTE_COLORS = (
+    (QPalette.Window, (53, 53, 53)),
+    (QPalette.WindowText, (255, 255, 255)),
+    (QPalette.Base, (25, 25, 25)),
+    (QPalette.AlternateBase, (53, 53, 53)),
+    (QPalette.ToolTipBase, (255, 255, 220)),
+    (QPalette.ToolTipText, (0, 0, 0)),
+    (QPalette.Text, (255, 255, 255)),
+    (QPalette.Button, (53, 53, 53)),
+    (QPalette.ButtonText, (255, 255, 255)),
+    (QPalette.BrightText, (255, 0, 0)),
+    (QPalette.Link, (42, 130, 218)),
+    (QPalette.Highlight, (42, 130, 218)),
+    (QPalette.HighlightedText, (0, 0, 0)),
+)
+DARK_STYLESHEET = "QToolTip { color: #ffffff; background-color: #2a82da; border: 1px solid white; }"
 
-        if success:
-            # Now it's safe to close the wizard
-            super().accept()
-        else:
-            self.progress_text.appendPlainText("\n\nSetup failed. Please check logs and restart the application.")
-            # Re-enable buttons on failure
-            self.button(QWizard.FinishButton).setEnabled(True)
-            self.button(QWizard.CancelButton).setEnabled(True)
+@lru_cache(maxsize=1)
+def build_dark_palette():
+    # Built on first use rather than at import, since Qt colours need the QApplication to exist
+    dark_palette = QPalette()
+    for role, rgb in DARK_PALETTE_COLORS:
+        dark_palette.setColor(role, QColor(*rgb))
+    return dark_palette
 
 def set_dark_theme(app):
-    dark_palette = QPalette()
-    dark_palette.setColor(QPalette.Window, QColor(53, 53, 53))
-    dark_palette.setColor(QPalette.WindowText, QColor(255, 255, 255))
-    dark_palette.setColor(QPalette.Base, QColor(25, 25, 25))
-    dark_palette.setColor(QPalette.AlternateBase, QColor(53, 53, 53))
-    dark_palette.setColor(QPalette.ToolTipBase, QColor(255, 255, 220))
-    dark_palette.setColor(QPalette.ToolTipText, QColor(0, 0, 0))
-    dark_palette.setColor(QPalette.Text, QColor(255, 255, 255))
-    dark_palette.setColor(QPalette.Button, QColor(53, 53, 53))
-    dark_palette.setColor(QPalette.ButtonText, QColor(255, 255, 255))
-    dark_palette.setColor(QPalette.BrightText, QColor(255, 0, 0))
-    dark_palette.setColor(QPalette.Link, QColor(42, 130, 218))
-    dark_palette.setColor(QPalette.Highlight, QColor(42, 130, 218))
-    dark_palette.setColor(QPalette.HighlightedText, QColor(0, 0, 0))
-    app.setPalette(dark_palette)
-    app.setStyleSheet("QToolTip { color: #ffffff; background-color: #2a82da; border: 1px solid white; }")
+    app.setPalette(build_dark_palette())
+    app.setStyleSheet(DARK_STYLESHEET)
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     app.setApplicationName("Fynix Library Builder")
-    app.setWindowIcon(QIcon("assets/FLB.png"))
+    load_assets()
+    app.setWindowIcon(FLB_ICON)
     app.setQuitOnLastWindowClosed(False) # Keep app running in tray
     app.setStyle("Fusion")
     set_dark_theme(app)
@@ -687,7 +919,7 @@ if __name__ == "__main__":
         window = FynixPlayerWindow()
         window.show()
     else:
-        wizard = SetupWizard()
+        wizard = create_setup_wizard()
         if wizard.exec():
             # This block will run after the wizard is successfully finished.
             # We can either exit and ask the user to restart, or launch the main window.